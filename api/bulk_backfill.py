@@ -0,0 +1,84 @@
+"""
+Backfills historical confirmations from NDJSON or CSV files.
+
+    python -m api.bulk_backfill confirmations.jsonl [more.csv ...]
+
+Uses the same chunked validation and COPY path as POST /api/confirmation/bulk.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+from api.bulk_ingest import BulkIngestor
+from api.live_aggregates import LiveAggregates, live_aggregates_enabled
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def get_connection():
+    return psycopg2.connect(
+        dbname=os.getenv("DATABASE_NAME"),
+        user=os.getenv("DATABASE_USER"),
+        password=os.getenv("DATABASE_PASSWORD"),
+        host=os.getenv("DATABASE_HOST", "localhost"),
+        port=int(os.getenv("DATABASE_PORT", 5432)),
+    )
+
+
+def backfill_file(conn, path: str, fmt: str = None, chunk_rows: int = None) -> dict:
+    # With live aggregates on, the batch ETL no longer adds to the headline tables, so we do it here
+    aggregates = LiveAggregates() if live_aggregates_enabled() else None
+    ingestor = BulkIngestor(fmt or BulkIngestor.detect_format(filename=path), chunk_rows=chunk_rows, aggregates=aggregates)
+
+    def load(chunk):
+        ingestor.load_lines(conn, chunk)
+        if aggregates is not None:
+            # Written in the chunk's own transaction, so they commit (or fail) with its rows
+            ingestor.record_inserted()
+            aggregates.flush_to(conn)
+        conn.commit()
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        chunk = []
+        for line in f:
+            chunk.append(line.rstrip("\n"))
+            if len(chunk) >= ingestor.chunk_rows:
+                load(chunk)
+                chunk = []
+                logging.info(f"{path}: {ingestor.inserted} inserted, {ingestor.duplicates} duplicates, {ingestor.rejected} rejected")
+
+        if chunk:
+            load(chunk)
+
+    return ingestor.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill M-Pesa confirmations from NDJSON/CSV files")
+    parser.add_argument("paths", nargs="+", help="NDJSON (.jsonl/.ndjson) or CSV files")
+    parser.add_argument("--format", choices=BulkIngestor.FORMATS, help="Override format detection by file extension")
+    parser.add_argument("--chunk-rows", type=int, help="Rows validated and COPYed per round trip")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    try:
+        report = {path: backfill_file(conn, path, args.format, args.chunk_rows) for path in args.paths}
+    finally:
+        conn.close()
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from api.models import MpesaRequest, TRANSACTION_COLUMNS
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+STAGING_TABLE = "mpesa_transactions_bulk_staging"
+COLUMN_LIST = ", ".join(TRANSACTION_COLUMNS)
+
+
+class BulkIngestor:
+    """
+    Loads a stream of NDJSON or CSV confirmations into mpesa_transactions.
+
+    Lines are consumed in chunks of chunk_rows: each chunk is validated
+    against MpesaRequest, COPYed into a temporary staging table and moved
+    into mpesa_transactions with a single INSERT ... ON CONFLICT DO NOTHING,
+    so memory stays bounded by the chunk size whatever the stream length.
+    CSV input needs a header row with MpesaRequest field names; quoted
+    fields spanning several lines are not supported.
+    """
+    FORMATS = ("ndjson", "csv")
+    MAX_REPORTED_ERRORS = 100
+
+    def __init__(self, fmt: str, chunk_rows: int = None, aggregates=None):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported bulk format: {fmt}")
+
+        self.format = fmt
+        self.aggregates = aggregates
+        self.chunk_rows = int(chunk_rows or os.getenv("BULK_CHUNK_ROWS", 5000))
+        self._csv_header = None
+        self._line_no = 0
+
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []
+        self._uncommitted = []
+
+    @staticmethod
+    def detect_format(content_type: str = None, filename: str = None) -> str:
+        content_type = (content_type or "").lower()
+        filename = (filename or "").lower()
+        if "csv" in content_type or filename.endswith(".csv"):
+            return "csv"
+        return "ndjson"
+
+    def parse_lines(self, lines: list) -> list:
+        """Parses raw lines into field dicts, recording unparseable lines as rejected."""
+        records = []
+        for line in lines:
+            self._line_no += 1
+            line = line.rstrip("\r")
+            if not line.strip():
+                continue
+
+            try:
+                if self.format == "ndjson":
+                    record = json.loads(line)
+                    if not isinstance(record, dict):
+                        raise ValueError("expected a JSON object")
+                elif self._csv_header is None:
+                    self._csv_header = next(csv.reader([line]))
+                    continue
+                else:
+                    values = next(csv.reader([line]))
+                    record = {key: value or None for key, value in zip(self._csv_header, values)}
+            except (ValueError, StopIteration) as e:
+                self._reject(self._line_no, str(e))
+                continue
+
+            records.append((self._line_no, record))
+        return records
+
+    def load_lines(self, db_connection, lines: list) -> list:
+        return self.load_chunk(db_connection, self.parse_lines(lines))
+
+    def load_chunk(self, db_connection, records: list) -> list:
+        """
+        Validates and COPYs one chunk inside the caller's transaction.
+        Returns the TransIDs of the valid rows. Live aggregates are only
+        recorded by record_inserted, once the caller commits.
+        """
+        self._uncommitted = []
+        rows = []
+        trans_ids = []
+        for line_no, record in records:
+            try:
+                request = MpesaRequest.model_validate(record)
+            except ValidationError as e:
+                self._reject(line_no, e.errors(include_url=False, include_input=False))
+                continue
+            rows.append(request.to_row())
+            trans_ids.append(request.TransID)
+
+        if not rows:
+            return trans_ids
+
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        with db_connection.cursor() as cur:
+            cur.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE}
+                ON COMMIT DELETE ROWS
+                AS SELECT {COLUMN_LIST} FROM mpesa_transactions WITH NO DATA
+            """)
+            cur.copy_expert(f"COPY {STAGING_TABLE} ({COLUMN_LIST}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute(f"""
+                INSERT INTO mpesa_transactions ({COLUMN_LIST})
+                SELECT DISTINCT ON (transaction_id) {COLUMN_LIST} FROM {STAGING_TABLE}
+                ON CONFLICT (transaction_id) DO NOTHING
+                RETURNING transaction_at, amount_cents
+            """)
+            inserted = cur.rowcount
+            # Held back until the caller's transaction commits (see record_inserted)
+            self._uncommitted = cur.fetchall() if self.aggregates is not None else []
+
+        self.inserted += inserted
+        self.duplicates += len(rows) - inserted
+        return trans_ids
+
+    def record_inserted(self):
+        """
+        Adds the rows the last chunk inserted to the live aggregates. Call it
+        once that chunk's transaction has committed (or inside it, just before
+        the aggregates are written in the same transaction).
+        """
+        if self.aggregates is not None:
+            for transaction_at, amount_cents in self._uncommitted:
+                self.aggregates.record_values(transaction_at, amount_cents)
+        self._uncommitted = []
+
+    def summary(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "lines": self._line_no,
+            "errors": self.errors,
+        }
+
+    def _reject(self, line_no: int, error):
+        self.rejected += 1
+        if len(self.errors) < self.MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": error})
+
+
+async def iter_stream_lines(byte_stream):
+    """Splits an async stream of bytes into text lines without buffering the whole body."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in byte_stream:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
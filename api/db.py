@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class AsyncConnectionPool:
+    """
+    Pool of psycopg2 connections shared by the API routes.
+
+    Checkouts are gated by an asyncio semaphore sized to the pool, so a
+    saturated pool makes callers wait on the event loop instead of failing,
+    and every blocking driver call runs on a worker thread.
+    """
+    def __init__(self, min_size: int = None, max_size: int = None, acquire_timeout: float = None):
+        self.dbname = os.getenv("DATABASE_NAME")
+        self.user = os.getenv("DATABASE_USER")
+        self.password = os.getenv("DATABASE_PASSWORD")
+        self.host = os.getenv("DATABASE_HOST", "localhost")
+        self.port = int(os.getenv("DATABASE_PORT", 5432))
+
+        self.min_size = int(min_size or os.getenv("DATABASE_POOL_MIN_SIZE", 2))
+        self.max_size = int(max_size or os.getenv("DATABASE_POOL_MAX_SIZE", 10))
+        self.acquire_timeout = float(acquire_timeout or os.getenv("DATABASE_POOL_TIMEOUT", 5))
+
+        self._pool = None
+        self._semaphore = None
+        # Serializes opening, so concurrent first callers share one pool
+        self._open_lock = asyncio.Lock()
+
+        # Saturation metrics
+        self._in_use = 0
+        self._waiting = 0
+        self._peak_in_use = 0
+        self._peak_waiting = 0
+        self._acquired_total = 0
+        self._timeouts_total = 0
+        self._wait_seconds_total = 0.0
+        self._wait_seconds_max = 0.0
+
+    async def open(self):
+        if self._pool is not None:
+            return
+
+        async with self._open_lock:
+            if self._pool is not None:
+                return
+
+            logging.info(f"Opening database pool (min={self.min_size}, max={self.max_size})")
+            pool = await asyncio.to_thread(
+                ThreadedConnectionPool,
+                self.min_size,
+                self.max_size,
+                dbname=self.dbname,
+                user=self.user,
+                password=self.password,
+                host=self.host,
+                port=self.port,
+            )
+            # The semaphore is set first: callers that see the pool use it straight away
+            self._semaphore = asyncio.Semaphore(self.max_size)
+            self._pool = pool
+
+    async def close(self):
+        if self._pool is None:
+            return
+
+        pool, self._pool = self._pool, None
+        await asyncio.to_thread(pool.closeall)
+        logging.info("Database pool closed")
+
+    async def run(self, fn, *args):
+        """
+        Runs fn(conn, *args) on a worker thread with a pooled connection.
+        The transaction is committed if fn returns and rolled back if it raises.
+        The worker thread checks the connection out and back in itself, so a
+        cancelled caller never returns a connection that is still in use; the
+        slot is freed when the thread is done, not when the caller gives up.
+        """
+        if self._pool is None:
+            await self.open()
+        await self._acquire_slot()
+
+        self._in_use += 1
+        self._acquired_total += 1
+        self._peak_in_use = max(self._peak_in_use, self._in_use)
+        task = asyncio.ensure_future(asyncio.to_thread(self._run_checked_out, self._pool, fn, *args))
+        task.add_done_callback(self._release_slot)
+        return await asyncio.shield(task)
+
+    async def _acquire_slot(self):
+        """Waits for a free connection slot without blocking the event loop."""
+        started = time.perf_counter()
+        self._waiting += 1
+        self._peak_waiting = max(self._peak_waiting, self._waiting)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts_total += 1
+            raise TimeoutError(f"Timed out after {self.acquire_timeout}s waiting for a database connection")
+        finally:
+            self._waiting -= 1
+
+        waited = time.perf_counter() - started
+        self._wait_seconds_total += waited
+        self._wait_seconds_max = max(self._wait_seconds_max, waited)
+
+    def _release_slot(self, task: asyncio.Future):
+        self._in_use -= 1
+        self._semaphore.release()
+        # Retrieved here so the failure of a call whose caller was cancelled is not reported as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "saturation": round(self._in_use / self.max_size, 4),
+            "peak_in_use": self._peak_in_use,
+            "peak_waiting": self._peak_waiting,
+            "acquired_total": self._acquired_total,
+            "timeouts_total": self._timeouts_total,
+            "avg_wait_ms": round(1000 * self._wait_seconds_total / max(self._acquired_total, 1), 3),
+            "max_wait_ms": round(1000 * self._wait_seconds_max, 3),
+        }
+
+    @classmethod
+    def _run_checked_out(cls, pool: ThreadedConnectionPool, fn, *args):
+        conn = pool.getconn()
+        try:
+            return cls._run_in_transaction(conn, fn, *args)
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+    @staticmethod
+    def _run_in_transaction(conn, fn, *args):
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
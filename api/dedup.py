@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import math
+import os
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from api.db import AsyncConnectionPool
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing of one blake2b digest."""
+    def __init__(self, capacity: int, error_rate: float):
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+
+class TransactionDeduplicator:
+    """
+    Answers "has this TransID been confirmed already?" without a database round trip.
+
+    Recently confirmed ids are kept in an LRU; every id ever seen goes into a
+    Bloom filter warmed from mpesa_transactions at startup. Only a Bloom
+    positive that is not in the LRU is checked against the database.
+    """
+    def __init__(self, db_pool: AsyncConnectionPool, lru_size: int = None,
+                 bloom_capacity: int = None, bloom_error_rate: float = None):
+        self.db_pool = db_pool
+        self.lru_size = int(lru_size or os.getenv("DEDUP_LRU_SIZE", 100_000))
+        self.bloom = BloomFilter(
+            capacity=int(bloom_capacity or os.getenv("DEDUP_BLOOM_CAPACITY", 10_000_000)),
+            error_rate=float(bloom_error_rate or os.getenv("DEDUP_BLOOM_ERROR_RATE", 0.001)),
+        )
+        self._recent = OrderedDict()
+        self.warmed = False
+
+        # Counters
+        self.lru_hits = 0
+        self.bloom_misses = 0
+        self.db_lookups = 0
+        self.db_hits = 0
+        self.false_positives = 0
+
+    async def warm(self):
+        try:
+            recent_ids = await self.db_pool.run(self._load_ids)
+        except Exception as e:
+            # Without a warm filter a Bloom miss proves nothing, so seen() falls back to the database
+            logging.error(f"Could not warm TransID dedup filter: {e}", exc_info=True)
+            return
+
+        for trans_id in reversed(recent_ids):
+            self._remember_recent(trans_id)
+        self.warmed = True
+        logging.info(f"TransID dedup filter warmed with {self.bloom.count} ids")
+
+    async def seen(self, trans_id: str) -> bool:
+        if trans_id in self._recent:
+            self._recent.move_to_end(trans_id)
+            self.lru_hits += 1
+            return True
+
+        if self.warmed and trans_id not in self.bloom:
+            self.bloom_misses += 1
+            return False
+
+        self.db_lookups += 1
+        if await self.db_pool.run(self._exists, trans_id):
+            self.db_hits += 1
+            self._remember_recent(trans_id)
+            return True
+
+        if self.warmed:
+            self.false_positives += 1
+        return False
+
+    def remember(self, trans_id: str):
+        self.bloom.add(trans_id)
+        self._remember_recent(trans_id)
+
+    def stats(self) -> dict:
+        return {
+            "warmed": self.warmed,
+            "bloom_ids": self.bloom.count,
+            "bloom_bits": self.bloom.num_bits,
+            "bloom_hashes": self.bloom.num_hashes,
+            "lru_size": len(self._recent),
+            "lru_hits": self.lru_hits,
+            "bloom_misses": self.bloom_misses,
+            "db_lookups": self.db_lookups,
+            "db_hits": self.db_hits,
+            "false_positives": self.false_positives,
+        }
+
+    def _remember_recent(self, trans_id: str):
+        self._recent[trans_id] = None
+        self._recent.move_to_end(trans_id)
+        if len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+
+    def _load_ids(self, db_connection) -> list:
+        # Named cursor so the whole id column is streamed rather than buffered client-side
+        with db_connection.cursor(name="dedup_warmup") as cur:
+            cur.itersize = 50_000
+            cur.execute("SELECT transaction_id FROM mpesa_transactions WHERE transaction_id IS NOT NULL")
+            for (trans_id,) in cur:
+                self.bloom.add(trans_id)
+
+        with db_connection.cursor() as cur:
+            cur.execute("""
+                SELECT transaction_id FROM mpesa_transactions
+                WHERE transaction_id IS NOT NULL
+                ORDER BY id DESC
+                LIMIT %s
+            """, (self.lru_size,))
+            return [trans_id for (trans_id,) in cur.fetchall()]
+
+    def _exists(self, db_connection, trans_id: str) -> bool:
+        with db_connection.cursor() as cur:
+            cur.execute("SELECT 1 FROM mpesa_transactions WHERE transaction_id = %s", (trans_id,))
+            return cur.fetchone() is not None
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from api.db import AsyncConnectionPool
+from api.models import MpesaRequest, TRANSACTION_COLUMNS
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+INSERT_TRANSACTIONS_SQL = f"""
+    INSERT INTO mpesa_transactions ({", ".join(TRANSACTION_COLUMNS)})
+    VALUES %s
+    ON CONFLICT (transaction_id) DO NOTHING
+    RETURNING transaction_at, amount_cents
+"""
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer for confirmations.
+
+    A confirmation is acknowledged once it has been appended and fsynced to a
+    local journal. A background task writes pending rows to mpesa_transactions
+    in multi-row inserts when a batch fills up or the batch delay elapses, then
+    records the last flushed sequence number in a checkpoint file. On start,
+    journal entries past the checkpoint are replayed. Inserts skip existing
+    transaction ids, so replaying an entry that was flushed just before a
+    crash is harmless.
+
+    A batch the database rejects for its data (not for being unreachable) is
+    retried row by row; rows that still fail are appended to a dead-letter file
+    next to the journal, so one bad payload cannot hold back the rest.
+
+    With live aggregates, only the rows a committed flush actually inserted are
+    recorded: duplicates skipped by the insert and dead-lettered rows are not.
+    """
+    JOURNAL_FILE = "journal.log"
+    CHECKPOINT_FILE = "checkpoint"
+    DEAD_LETTER_FILE = "dead_letter.log"
+
+    def __init__(self, db_pool: AsyncConnectionPool, journal_dir: str = None,
+                 max_batch_rows: int = None, max_batch_delay_ms: int = None, aggregates=None):
+        self.db_pool = db_pool
+        self.aggregates = aggregates
+        self.journal_dir = journal_dir or os.getenv("INGEST_JOURNAL_DIR", "ingest_journal")
+        self.max_batch_rows = int(max_batch_rows or os.getenv("INGEST_BATCH_ROWS", 500))
+        self.max_batch_delay = int(max_batch_delay_ms or os.getenv("INGEST_BATCH_DELAY_MS", 200)) / 1000
+        self.compact_bytes = int(os.getenv("INGEST_JOURNAL_COMPACT_BYTES", 64 * 1024 * 1024))
+
+        self.journal_path = os.path.join(self.journal_dir, self.JOURNAL_FILE)
+        self.checkpoint_path = os.path.join(self.journal_dir, self.CHECKPOINT_FILE)
+        self.dead_letter_path = os.path.join(self.journal_dir, self.DEAD_LETTER_FILE)
+
+        self._journal = None
+        self._lock = threading.Lock()        # guards journal writes and the pending list
+        self._sync_lock = threading.Lock()   # one fsync covers every append queued behind it
+        self._seq = 0
+        self._synced_seq = 0
+        self._flushed_seq = 0
+        self._pending = []                   # [(seq, payload)] in journal order
+
+        self._wakeup = None
+        self._flusher = None
+        self._stopping = False
+
+        # Metrics
+        self._replayed_on_start = 0
+        self._flushed_rows_total = 0
+        self._batches_total = 0
+        self._flush_errors_total = 0
+        self._dead_lettered_total = 0
+        self._last_batch_ms = 0.0
+
+    async def start(self):
+        await asyncio.to_thread(self._recover)
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+        if self._pending:
+            self._wakeup.set()
+
+    async def stop(self):
+        if self._flusher is None:
+            return
+
+        self._stopping = True
+        self._wakeup.set()
+        await self._flusher
+        self._flusher = None
+        await asyncio.to_thread(self._close_journal)
+
+    async def append(self, data: MpesaRequest):
+        """Durably journals a confirmation. Returns once it survives a crash."""
+        await asyncio.to_thread(self._append, data.model_dump())
+
+        if len(self._pending) >= self.max_batch_rows:
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "pending_rows": len(self._pending),
+            "journal_seq": self._seq,
+            "flushed_seq": self._flushed_seq,
+            "replayed_on_start": self._replayed_on_start,
+            "flushed_rows_total": self._flushed_rows_total,
+            "batches_total": self._batches_total,
+            "flush_errors_total": self._flush_errors_total,
+            "dead_lettered_total": self._dead_lettered_total,
+            "last_batch_ms": round(self._last_batch_ms, 3),
+            "max_batch_rows": self.max_batch_rows,
+            "max_batch_delay_ms": int(self.max_batch_delay * 1000),
+        }
+
+    def _append(self, payload: dict):
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._journal.write(json.dumps({"seq": seq, "payload": payload}) + "\n")
+            self._pending.append((seq, payload))
+
+        self._sync(seq)
+
+    def _sync(self, seq: int):
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._lock:
+                self._journal.flush()
+                target = self._seq
+            os.fsync(self._journal.fileno())
+            self._synced_seq = target
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_batch_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            stopping = self._stopping
+            flushed = await self._flush()
+
+            if stopping:
+                # Anything still pending stays in the journal and is replayed on start
+                break
+            if not flushed:
+                # The database is unavailable; back off before retrying
+                await asyncio.sleep(self.max_batch_delay)
+
+    async def _flush(self) -> bool:
+        """Writes all pending rows in batches. Returns False if a batch failed."""
+        while self._pending:
+            with self._lock:
+                batch = self._pending[:self.max_batch_rows]
+
+            started = time.perf_counter()
+            try:
+                inserted = await self.db_pool.run(self._write_batch, [payload for _, payload in batch])
+                self._record(inserted)
+            except Exception as e:
+                self._flush_errors_total += 1
+                if not self._is_data_error(e):
+                    logging.error(f"Ingest flush of {len(batch)} rows failed: {e}", exc_info=True)
+                    return False
+
+                logging.warning(f"Ingest flush of {len(batch)} rows rejected ({e}); retrying row by row")
+                done = await self._flush_rows(batch)
+                if done < len(batch):
+                    await self._advance(batch[:done])
+                    return False
+
+            await self._advance(batch)
+
+            self._last_batch_ms = 1000 * (time.perf_counter() - started)
+            self._flushed_rows_total += len(batch)
+            self._batches_total += 1
+
+        await asyncio.to_thread(self._maybe_compact)
+        return True
+
+    async def _flush_rows(self, batch: list) -> int:
+        """
+        Writes the batch one row per transaction, dead-lettering rows with bad
+        data. Returns how many leading rows are done; fewer than the batch when
+        the database became unavailable.
+        """
+        for done, (seq, payload) in enumerate(batch):
+            try:
+                self._record(await self.db_pool.run(self._write_batch, [payload]))
+            except Exception as e:
+                if not self._is_data_error(e):
+                    logging.error(f"Ingest flush of journal entry {seq} failed: {e}", exc_info=True)
+                    return done
+                await asyncio.to_thread(self._dead_letter, seq, payload, e)
+        return len(batch)
+
+    async def _advance(self, entries: list):
+        # The checkpoint moves past entries that are stored or dead-lettered
+        if not entries:
+            return
+        await asyncio.to_thread(self._checkpoint, entries[-1][0])
+        with self._lock:
+            del self._pending[:len(entries)]
+
+    def _record(self, inserted: list):
+        # Called once the flush has committed
+        if self.aggregates is not None:
+            for transaction_at, amount_cents in inserted:
+                self.aggregates.record_values(transaction_at, amount_cents)
+
+    @staticmethod
+    def _is_data_error(e: Exception) -> bool:
+        """
+        True when retrying cannot help: the database rejected the values
+        (DataError, IntegrityError) or the payload could not be turned into a
+        row (e.g. a ValueError for NUL bytes). Connection and timeout errors,
+        and any other database error, are transient.
+        """
+        if isinstance(e, (psycopg2.DataError, psycopg2.IntegrityError)):
+            return True
+        return not isinstance(e, (psycopg2.Error, TimeoutError, OSError))
+
+    def _dead_letter(self, seq: int, payload: dict, error: Exception):
+        with open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps({"seq": seq, "payload": payload, "error": str(error)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._dead_lettered_total += 1
+        logging.error(f"Ingest journal entry {seq} dead-lettered to {self.dead_letter_path}: {error}")
+
+    def _write_batch(self, db_connection, payloads: list) -> list:
+        """Inserts the payloads; returns (transaction_at, amount_cents) of the rows actually inserted."""
+        rows = [MpesaRequest.model_construct(**payload).to_row() for payload in payloads]
+        with db_connection.cursor() as cur:
+            return execute_values(cur, INSERT_TRANSACTIONS_SQL, rows, page_size=len(rows), fetch=True)
+
+    def _checkpoint(self, seq: int):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        self._flushed_seq = seq
+
+    def _recover(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                self._flushed_seq = int(f.read().strip() or 0)
+
+        self._seq = self._flushed_seq
+        if os.path.exists(self.journal_path):
+            complete_bytes = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # A torn final line was never fsynced, so it was never acknowledged
+                        logging.warning("Dropping incomplete final ingest journal entry")
+                        break
+                    complete_bytes += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning("Skipping unreadable ingest journal entry")
+                        continue
+                    self._seq = max(self._seq, entry["seq"])
+                    if entry["seq"] > self._flushed_seq:
+                        self._pending.append((entry["seq"], entry["payload"]))
+
+            # Cut the torn bytes off, or the next append would be glued onto them
+            if complete_bytes < os.path.getsize(self.journal_path):
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(complete_bytes)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        self._synced_seq = self._seq
+        self._replayed_on_start = len(self._pending)
+        if self._pending:
+            logging.info(f"Replaying {len(self._pending)} unflushed confirmations from the ingest journal")
+
+        self._journal = open(self.journal_path, "a")
+
+    def _maybe_compact(self):
+        # Truncating is only safe when every journaled entry is in the database
+        with self._sync_lock, self._lock:
+            if self._pending or self._journal.tell() < self.compact_bytes:
+                return
+            self._journal.truncate(0)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            logging.info("Ingest journal compacted")
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
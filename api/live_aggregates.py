@@ -0,0 +1,154 @@
+import asyncio
+import calendar
+import logging
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from api.db import AsyncConnectionPool
+from api.models import MpesaRequest
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def live_aggregates_enabled() -> bool:
+    return os.getenv("LIVE_AGGREGATES_ENABLED", "false").lower() == "true"
+
+
+class LiveAggregates:
+    """
+    Running headline metrics maintained as confirmations land.
+
+    Each accepted payment bumps an in-memory count, volume and its
+    day-of-week x hour cell. Every LIVE_AGGREGATES_FLUSH_SECONDS the deltas
+    are swapped out and added to transaction_metrics and peak_hours, so the
+    dashboard KPIs are seconds-fresh. When enabled, the batch loader stops
+    adding to those two tables to avoid counting payments twice. Deltas not
+    yet flushed when the process dies are lost.
+    """
+    def __init__(self, db_pool: AsyncConnectionPool = None, flush_seconds: float = None):
+        self.db_pool = db_pool
+        self.flush_seconds = float(flush_seconds or os.getenv("LIVE_AGGREGATES_FLUSH_SECONDS", 5))
+
+        self._lock = threading.Lock()
+        self._reset()
+        self._flusher = None
+
+        self.flushes_total = 0
+        self.flush_errors_total = 0
+        self.recorded_total = 0
+
+    def record(self, data: MpesaRequest):
+        self.record_values(data.transaction_at(), data.amount_cents())
+
+    def record_values(self, transaction_at, amount_cents):
+        with self._lock:
+            self._count += 1
+            self._volume_cents += amount_cents or 0
+            if transaction_at is not None:
+                self._cells[transaction_at.weekday()][transaction_at.hour] += 1
+            self.recorded_total += 1
+
+    async def start(self):
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        deltas = self._take()
+        if deltas is None:
+            return
+
+        try:
+            await self.db_pool.run(self._write, deltas)
+            self.flushes_total += 1
+        except Exception as e:
+            # Put the deltas back so the next flush retries them
+            self._restore(deltas)
+            self.flush_errors_total += 1
+            logging.error(f"Flushing live aggregates failed: {e}", exc_info=True)
+
+    def flush_to(self, db_connection):
+        """Adds pending deltas inside the caller's transaction (used by the bulk CLI)."""
+        deltas = self._take()
+        if deltas is not None:
+            self._write(db_connection, deltas)
+
+    def stats(self) -> dict:
+        return {
+            "pending_count": self._count,
+            "pending_volume": self._volume_cents / 100,
+            "recorded_total": self.recorded_total,
+            "flushes_total": self.flushes_total,
+            "flush_errors_total": self.flush_errors_total,
+            "flush_seconds": self.flush_seconds,
+        }
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def _reset(self):
+        self._count = 0
+        self._volume_cents = 0
+        self._cells = [[0] * 24 for _ in range(7)]
+
+    def _take(self):
+        with self._lock:
+            if self._count == 0:
+                return None
+            deltas = (self._count, self._volume_cents, self._cells)
+            self._reset()
+        return deltas
+
+    def _restore(self, deltas):
+        count, volume_cents, cells = deltas
+        with self._lock:
+            self._count += count
+            self._volume_cents += volume_cents
+            for day in range(7):
+                for hour in range(24):
+                    self._cells[day][hour] += cells[day][hour]
+
+    def _write(self, db_connection, deltas):
+        count, volume_cents, cells = deltas
+        volume = volume_cents / 100
+
+        with db_connection.cursor() as cur:
+            # The single metrics row (id = 1) the batch loader and the dashboard use as well
+            cur.execute("""
+                INSERT INTO transaction_metrics (id, total_transactions, transaction_volume)
+                VALUES (1, %s, %s)
+                ON CONFLICT (id) DO UPDATE SET
+                    total_transactions = transaction_metrics.total_transactions + EXCLUDED.total_transactions,
+                    transaction_volume = transaction_metrics.transaction_volume + EXCLUDED.transaction_volume
+            """, (count, volume))
+
+            for day, hours in enumerate(cells):
+                # peak_hours columns are 1-based hours ("1" = 00:00-00:59)
+                nonzero = [(str(hour + 1), value) for hour, value in enumerate(hours) if value]
+                if not nonzero:
+                    continue
+                columns = ", ".join(f'"{hour}"' for hour, _ in nonzero)
+                placeholders = ", ".join(["%s"] * len(nonzero))
+                increments = ", ".join(f'"{hour}" = peak_hours."{hour}" + EXCLUDED."{hour}"' for hour, _ in nonzero)
+                cur.execute(f"""
+                    INSERT INTO peak_hours (day_of_week, {columns})
+                    VALUES (%s, {placeholders})
+                    ON CONFLICT (day_of_week) DO UPDATE SET {increments}
+                """, (calendar.day_name[day], *[value for _, value in nonzero]))
@@ -1 +1 @@
-from .mpesa_request import MpesaRequest
\ No newline at end of file
+from .mpesa_request import MpesaRequest, TRANSACTION_COLUMNS
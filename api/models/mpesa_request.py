@@ -1,6 +1,33 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from pydantic import BaseModel
 from typing import Optional
 
+TRANS_TIME_FORMAT = "%Y%m%d%H%M%S"
+
+# Range of the amount_cents BIGINT column
+BIGINT_MIN = -2 ** 63
+BIGINT_MAX = 2 ** 63 - 1
+
+# Column order of mpesa_transactions rows produced by MpesaRequest.to_row()
+TRANSACTION_COLUMNS = (
+    "transaction_type",
+    "transaction_id",
+    "transaction_time",
+    "transaction_amount",
+    "business_short_code",
+    "bill_ref_number",
+    "invoice_number",
+    "org_account_balance",
+    "third_party_tansaaction_id",
+    "msisdn",
+    "first_name",
+    "middle_name",
+    "last_name",
+    "transaction_at",
+    "amount_cents",
+)
+
 class MpesaRequest(BaseModel):
     TransactionType: str
     TransID: str
@@ -15,3 +42,43 @@ class MpesaRequest(BaseModel):
     FirstName: str
     MiddleName: Optional[str] = None
     LastName: Optional[str] = None
+
+    def to_row(self) -> tuple:
+        return (
+            self.TransactionType,
+            self.TransID,
+            self.TransTime,
+            self.TransAmount,
+            self.BusinessShortCode,
+            self.BillRefNumber,
+            self.InvoiceNumber,
+            self.OrgAccountBalance,
+            self.ThirdPartyTransID,
+            self.MSISDN,
+            self.FirstName,
+            self.MiddleName,
+            self.LastName,
+            self.transaction_at(),
+            self.amount_cents()
+        )
+
+    def transaction_at(self) -> Optional[datetime]:
+        """TransTime (YYYYMMDDHHMMSS) as a datetime, or None if it does not parse."""
+        try:
+            return datetime.strptime(self.TransTime, TRANS_TIME_FORMAT)
+        except (TypeError, ValueError):
+            return None
+
+    def amount_cents(self) -> Optional[int]:
+        """TransAmount in integer cents, or None if it is not a number or does not fit amount_cents (BIGINT)."""
+        try:
+            amount = Decimal(self.TransAmount.strip())
+            if not amount.is_finite():
+                return None
+            # quantize raises InvalidOperation when the result has more digits than the context allows
+            cents = int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        except (AttributeError, InvalidOperation):
+            return None
+        if not BIGINT_MIN <= cents <= BIGINT_MAX:
+            return None
+        return cents
@@ -1,62 +1,120 @@
-from api.models import MpesaRequest
-import psycopg2
-from dotenv import load_dotenv
 import os
+import logging
+from dotenv import load_dotenv
+from psycopg2 import errors
+from api.models import MpesaRequest, TRANSACTION_COLUMNS
+from api.db import AsyncConnectionPool
+from api.ingest_buffer import IngestBuffer
+from api.dedup import TransactionDeduplicator
+from api.bulk_ingest import BulkIngestor
+from api.validation_rules import ValidationRuleEngine
+from api.live_aggregates import LiveAggregates, live_aggregates_enabled
 
 load_dotenv()
 
+INSERT_TRANSACTION_SQL = f"""
+    INSERT INTO mpesa_transactions ({", ".join(TRANSACTION_COLUMNS)})
+    VALUES ({", ".join(["%s"] * len(TRANSACTION_COLUMNS))})
+"""
+
+
 class MpesaAPI:
+    def __init__(self, db_pool: AsyncConnectionPool):
+        self.db_pool = db_pool
+
+        self.live_aggregates = LiveAggregates(db_pool) if live_aggregates_enabled() else None
+
+        # "direct" inserts each confirmation before acking; "buffered" acks once journaled
+        self.ingest_mode = os.getenv("INGEST_MODE", "direct")
+        self.ingest_buffer = IngestBuffer(db_pool, aggregates=self.live_aggregates) if self.ingest_mode == "buffered" else None
+
+        dedup_enabled = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+        self.deduplicator = TransactionDeduplicator(db_pool) if dedup_enabled else None
+
+        self.rule_engine = ValidationRuleEngine(db_pool)
+
+    async def start(self):
+        await self.db_pool.open()
+        await self.rule_engine.start()
+        if self.ingest_buffer:
+            await self.ingest_buffer.start()
+        if self.deduplicator:
+            await self.deduplicator.warm()
+        if self.live_aggregates:
+            await self.live_aggregates.start()
+
+    async def stop(self):
+        await self.rule_engine.stop()
+        if self.live_aggregates:
+            await self.live_aggregates.stop()
+        if self.ingest_buffer:
+            await self.ingest_buffer.stop()
+        await self.db_pool.close()
 
     async def process_confirmation(self, confirmation_data: MpesaRequest):
-        self.save_transaction(confirmation_data)
+        # Safaricom retries callbacks; a repeated TransID is acknowledged without a second insert
+        if self.deduplicator and await self.deduplicator.seen(confirmation_data.TransID):
+            return {"status": "confirmed"}
+
+        if self.ingest_buffer:
+            # The buffer records live aggregates for the rows its flushes actually insert
+            await self.ingest_buffer.append(confirmation_data)
+        else:
+            try:
+                await self.save_transaction(confirmation_data)
+            except errors.UniqueViolation:
+                # A retry of a stored callback: acknowledged, but its amounts are already counted
+                if self.deduplicator:
+                    self.deduplicator.remember(confirmation_data.TransID)
+                return {"status": "confirmed"}
+            if self.live_aggregates:
+                self.live_aggregates.record(confirmation_data)
+
+        if self.deduplicator:
+            self.deduplicator.remember(confirmation_data.TransID)
         return {"status": "confirmed"}
 
+    async def process_bulk_confirmations(self, lines, fmt: str):
+        """Streams NDJSON/CSV confirmations into the database chunk by chunk."""
+        ingestor = BulkIngestor(fmt, aggregates=self.live_aggregates)
+        chunk = []
+        async for line in lines:
+            chunk.append(line)
+            if len(chunk) >= ingestor.chunk_rows:
+                await self._load_bulk_chunk(ingestor, chunk)
+                chunk = []
+
+        if chunk:
+            await self._load_bulk_chunk(ingestor, chunk)
+
+        logging.info(f"Bulk confirmations loaded: {ingestor.summary()}")
+        return ingestor.summary()
+
     async def validate_transaction(self, validation_data: MpesaRequest):
-        print("M-Pesa Validation Data:", validation_data)
-        return {"status": "validated"}
-
-    def save_transaction(self, data: MpesaRequest):
-        db_connection = psycopg2.connect(
-            dbname=os.getenv('DATABASE_NAME'),
-            user=os.getenv('DATABASE_USER'),
-            password=os.getenv('DATABASE_PASSWORD'),
-            host='localhost',
-            port=5432
-        )
-        cur = db_connection.cursor()
-
-        cur.execute("""
-            INSERT INTO mpesa_transactions (
-                transaction_type, 
-                transaction_id, 
-                transaction_time, 
-                transaction_amount, 
-                business_short_code, 
-                bill_ref_number, 
-                invoice_number, 
-                org_account_balance,
-                third_party_tansaaction_id,
-                msisdn,
-                first_name,
-                middle_name,
-                last_name
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            data.TransactionType, 
-            data.TransID, 
-            data.TransTime, 
-            data.TransAmount,
-            data.BusinessShortCode, 
-            data.BillRefNumber, 
-            data.InvoiceNumber,
-            data.OrgAccountBalance, 
-            data.ThirdPartyTransID,
-            data.MSISDN, 
-            data.FirstName, 
-            data.MiddleName, 
-            data.LastName
-        ))
-
-        db_connection.commit()
-        cur.close()
-        db_connection.close()
+        # Answered from the in-process rule snapshot; no database round trip
+        return self.rule_engine.evaluate(validation_data)
+
+    async def save_transaction(self, data: MpesaRequest):
+        await self.db_pool.run(self._insert_transaction, data)
+
+    def stats(self) -> dict:
+        stats = {"db_pool": self.db_pool.stats(), "validation_rules": self.rule_engine.stats()}
+        if self.ingest_buffer:
+            stats["ingest_buffer"] = self.ingest_buffer.stats()
+        if self.deduplicator:
+            stats["dedup"] = self.deduplicator.stats()
+        if self.live_aggregates:
+            stats["live_aggregates"] = self.live_aggregates.stats()
+        return stats
+
+    async def _load_bulk_chunk(self, ingestor: BulkIngestor, lines: list):
+        trans_ids = await self.db_pool.run(ingestor.load_lines, lines)
+        # The chunk has committed: its inserted rows may now count
+        ingestor.record_inserted()
+        if self.deduplicator:
+            for trans_id in trans_ids:
+                self.deduplicator.remember(trans_id)
+
+    def _insert_transaction(self, db_connection, data: MpesaRequest):
+        with db_connection.cursor() as cur:
+            cur.execute(INSERT_TRANSACTION_SQL, data.to_row())
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from api.models import MpesaRequest
 from api.mpesa_api import MpesaAPI
+from api.db import AsyncConnectionPool
+from api.bulk_ingest import BulkIngestor, iter_stream_lines
 
 router = APIRouter()
 
-mpesa_api = MpesaAPI()
+db_pool = AsyncConnectionPool()
+mpesa_api = MpesaAPI(db_pool)
 
 @router.post("/api/confirmation")
 async def confirmation_transaction(request: MpesaRequest):
@@ -14,9 +17,24 @@ async def confirmation_transaction(request: MpesaRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/api/confirmation/bulk")
+async def bulk_confirmation_transactions(request: Request, format: str = None):
+    # NDJSON by default; CSV when asked for or sent as text/csv
+    fmt = format or BulkIngestor.detect_format(content_type=request.headers.get("content-type"))
+    try:
+        return await mpesa_api.process_bulk_confirmations(iter_stream_lines(request.stream()), fmt)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/api/validation")
 async def validate_transaction(request: MpesaRequest):
     try:
         return await mpesa_api.validate_transaction(request)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/api/metrics")
+async def api_metrics():
+    return mpesa_api.stats()
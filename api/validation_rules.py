@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from decimal import Decimal
+
+from dotenv import load_dotenv
+
+from api.db import AsyncConnectionPool
+from api.models import MpesaRequest
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+RULE_TYPES = ("blocked_msisdn", "bill_ref_pattern", "amount_limit")
+
+# Daraja C2B validation result codes
+RESULT_CODES = {
+    "blocked_msisdn": "C2B00011",    # Invalid MSISDN
+    "bill_ref_pattern": "C2B00012",  # Invalid Account Number
+    "amount_limit": "C2B00013",      # Invalid Amount
+}
+
+
+class CompiledRules:
+    """
+    Immutable, precompiled snapshot of the validation rules.
+
+    Lookups are a frozenset membership test, a dict lookup and one combined
+    regex per short code, so evaluation never touches the database.
+    """
+    def __init__(self, rules: list, version: str):
+        self.version = version
+        self.size = len(rules)
+
+        blocked = set()
+        amount_limits = {}
+        patterns = {}
+        for rule_type, account, value in rules:
+            if rule_type == "blocked_msisdn":
+                blocked.add(value.strip())
+            elif rule_type == "amount_limit":
+                amount_limits[account] = int(Decimal(value) * 100)
+            elif rule_type == "bill_ref_pattern":
+                patterns.setdefault(account, []).append(value)
+            else:
+                raise ValueError(f"Unknown validation rule type: {rule_type}")
+
+        self.blocked_msisdns = frozenset(blocked)
+        self.amount_limits = amount_limits
+        self.default_amount_limit = amount_limits.pop(None, None)
+        self.bill_ref_patterns = {
+            account: re.compile("|".join(f"(?:{pattern})" for pattern in account_patterns))
+            for account, account_patterns in patterns.items()
+        }
+        self.default_bill_ref_pattern = self.bill_ref_patterns.pop(None, None)
+
+    def check(self, rule_type: str, request: MpesaRequest) -> bool:
+        if rule_type == "blocked_msisdn":
+            return request.MSISDN not in self.blocked_msisdns
+
+        if rule_type == "bill_ref_pattern":
+            pattern = self.bill_ref_patterns.get(request.BusinessShortCode, self.default_bill_ref_pattern)
+            return pattern is None or pattern.fullmatch(request.BillRefNumber or "") is not None
+
+        limit = self.amount_limits.get(request.BillRefNumber, self.default_amount_limit)
+        if limit is None:
+            return True
+        amount = request.amount_cents()
+        return amount is not None and amount <= limit
+
+
+class ValidationRuleEngine:
+    """
+    Evaluates /api/validation requests against in-process rules.
+
+    Rules come from VALIDATION_RULES_PATH (JSON) when set, otherwise from the
+    validation_rules table. A background task polls the source every
+    VALIDATION_RULES_RELOAD_SECONDS and swaps in a freshly compiled snapshot
+    when it changes, so edits apply without a restart.
+    """
+    def __init__(self, db_pool: AsyncConnectionPool, rules_path: str = None, reload_seconds: float = None):
+        self.db_pool = db_pool
+        self.rules_path = rules_path or os.getenv("VALIDATION_RULES_PATH")
+        self.reload_seconds = float(reload_seconds or os.getenv("VALIDATION_RULES_RELOAD_SECONDS", 10))
+
+        self._rules = CompiledRules([], version="empty")
+        self._reloader = None
+        self.reloads_total = 0
+        self.reload_errors_total = 0
+
+        self._latency = {
+            rule_type: {"evaluations": 0, "rejections": 0, "total_ns": 0, "max_ns": 0}
+            for rule_type in RULE_TYPES
+        }
+
+    async def start(self):
+        await self.reload()
+        self._reloader = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._reloader is not None:
+            self._reloader.cancel()
+            try:
+                await self._reloader
+            except asyncio.CancelledError:
+                pass
+            self._reloader = None
+
+    def evaluate(self, request: MpesaRequest) -> dict:
+        rules = self._rules
+        for rule_type in RULE_TYPES:
+            started = time.perf_counter_ns()
+            passed = rules.check(rule_type, request)
+            elapsed = time.perf_counter_ns() - started
+
+            counters = self._latency[rule_type]
+            counters["evaluations"] += 1
+            counters["total_ns"] += elapsed
+            counters["max_ns"] = max(counters["max_ns"], elapsed)
+
+            if not passed:
+                counters["rejections"] += 1
+                return {"status": "rejected", "ResultCode": RESULT_CODES[rule_type], "ResultDesc": "Rejected"}
+
+        return {"status": "validated", "ResultCode": "0", "ResultDesc": "Accepted"}
+
+    async def reload(self):
+        try:
+            version = await self._source_version()
+            if version == self._rules.version:
+                return
+
+            rules = await self._load_rules()
+            self._rules = CompiledRules(rules, version=version)
+            self.reloads_total += 1
+            logging.info(f"Loaded {self._rules.size} validation rules (version {version})")
+        except Exception as e:
+            # Keep serving the last good snapshot
+            self.reload_errors_total += 1
+            logging.error(f"Reloading validation rules failed: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "version": self._rules.version,
+            "rules": self._rules.size,
+            "reloads_total": self.reloads_total,
+            "reload_errors_total": self.reload_errors_total,
+            "per_rule": {
+                rule_type: {
+                    "evaluations": counters["evaluations"],
+                    "rejections": counters["rejections"],
+                    "avg_us": round(counters["total_ns"] / max(counters["evaluations"], 1) / 1000, 3),
+                    "max_us": round(counters["max_ns"] / 1000, 3),
+                }
+                for rule_type, counters in self._latency.items()
+            },
+        }
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            await self.reload()
+
+    async def _source_version(self) -> str:
+        if self.rules_path:
+            stat = await asyncio.to_thread(os.stat, self.rules_path)
+            return f"{stat.st_mtime_ns}:{stat.st_size}"
+        return await self.db_pool.run(self._table_version)
+
+    async def _load_rules(self) -> list:
+        if self.rules_path:
+            return await asyncio.to_thread(self._read_rules_file)
+        return await self.db_pool.run(self._read_rules_table)
+
+    def _read_rules_file(self) -> list:
+        """
+        Expected shape:
+            {"blocked_msisdns": ["2547..."],
+             "amount_limits": {"default": 150000, "<BillRefNumber>": 5000},
+             "bill_ref_patterns": {"default": ["[A-Z0-9]{4,12}"], "<BusinessShortCode>": ["INV-\\\\d+"]}}
+        """
+        with open(self.rules_path, "r") as f:
+            config = json.load(f)
+
+        def account(key):
+            return None if key == "default" else key
+
+        rules = [("blocked_msisdn", None, msisdn) for msisdn in config.get("blocked_msisdns", [])]
+        rules += [("amount_limit", account(key), str(limit)) for key, limit in config.get("amount_limits", {}).items()]
+        rules += [
+            ("bill_ref_pattern", account(key), pattern)
+            for key, patterns in config.get("bill_ref_patterns", {}).items()
+            for pattern in patterns
+        ]
+        return rules
+
+    def _table_version(self, db_connection) -> str:
+        with db_connection.cursor() as cur:
+            cur.execute("SELECT count(*), max(updated_at) FROM validation_rules")
+            count, updated_at = cur.fetchone()
+        return f"{count}:{updated_at}"
+
+    def _read_rules_table(self, db_connection) -> list:
+        with db_connection.cursor() as cur:
+            cur.execute("SELECT rule_type, account, value FROM validation_rules WHERE enabled")
+            return cur.fetchall()
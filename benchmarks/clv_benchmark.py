@@ -0,0 +1,106 @@
+"""
+Times the vectorized CLV against the former row-wise relativedelta version.
+
+    python -m benchmarks.clv_benchmark [--sizes 10000 100000 1000000] [--legacy-sample 100000]
+
+Customers are synthetic, with first/last seen dates that hit month ends, leap
+days and equal timestamps. The row-wise version runs on at most
+--legacy-sample rows per size and its time is scaled up. The two results are
+compared exactly on that sample, and the script exits non-zero on any mismatch.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from service.etl.clv import customer_lifetime_value
+
+
+def legacy_clv(row):
+    # TransactionTransformer._calculate_clv before vectorization
+    if row['first_seen'] > row['last_seen']:
+        return 0.0
+
+    delta = relativedelta(row['last_seen'], row['first_seen'])
+    months = delta.years * 12 + delta.months + (delta.days / 30.44)
+    months_active = round(months, 2)
+
+    if months_active == 0:
+        return 0.0
+
+    frequency = row['total_transactions'] / months_active
+    return row['avg_spend'] * frequency * months_active
+
+
+def synthetic_customers(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2020-01-01T00:00:00', 's')
+
+    first_seen = start + rng.integers(0, 5 * 365 * 86400, n).astype('timedelta64[s]')
+    # Snap a share of first_seen to month ends (29th-31st) to exercise day clamping
+    month_end = rng.random(n) < 0.2
+    month_start = first_seen.astype('datetime64[M]')
+    first_seen[month_end] = ((month_start[month_end] + 1).astype('datetime64[D]') - 1).astype('datetime64[s]') \
+        + (first_seen[month_end] - first_seen[month_end].astype('datetime64[D]'))
+
+    last_seen = first_seen + rng.integers(0, 3 * 365 * 86400, n).astype('timedelta64[s]')
+    # Some customers seen once, some with clock skew (last before first)
+    same = rng.random(n) < 0.05
+    last_seen[same] = first_seen[same]
+    skewed = rng.random(n) < 0.01
+    last_seen[skewed] = first_seen[skewed] - np.timedelta64(3600, 's')
+
+    total_transactions = rng.integers(1, 500, n)
+    return pd.DataFrame({
+        'first_seen': pd.to_datetime(first_seen),
+        'last_seen': pd.to_datetime(last_seen),
+        'total_transactions': total_transactions,
+        'avg_spend': np.round(rng.lognormal(6.5, 1.2, n), 2),
+    })
+
+
+def run(n: int, legacy_sample: int, seed: int) -> dict:
+    df = synthetic_customers(n, seed)
+
+    started = time.perf_counter()
+    vectorized = customer_lifetime_value(df)
+    vectorized_seconds = time.perf_counter() - started
+
+    sample = df.iloc[:min(n, legacy_sample)]
+    started = time.perf_counter()
+    legacy = sample.apply(legacy_clv, axis=1).to_numpy(dtype=np.float64)
+    legacy_seconds = (time.perf_counter() - started) * n / len(sample)
+
+    mismatches = int(np.sum(legacy != vectorized[:len(sample)]))
+    return {
+        "customers": n,
+        "vectorized_seconds": round(vectorized_seconds, 4),
+        "legacy_seconds": round(legacy_seconds, 4),
+        "legacy_extrapolated": len(sample) < n,
+        "speedup": round(legacy_seconds / vectorized_seconds, 1) if vectorized_seconds else None,
+        "compared_rows": len(sample),
+        "mismatches": mismatches,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark vectorized vs row-wise CLV")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-sample", type=int, default=100_000, help="Rows the row-wise version is timed on")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    results = [run(n, args.legacy_sample, args.seed) for n in args.sizes]
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if any(result["mismatches"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compares the extractor backends on the live mpesa_transactions table.
+
+    python -m benchmarks.extract_benchmark [--after-id 0] [--repeat 3] [--partitions 1 4 8] [--out extract.json]
+
+Each backend runs in a fresh subprocess so its peak resident memory (ru_maxrss)
+is not inflated by the other one. Reported per backend: rows, best wall time,
+rows/sec, peak RSS, the in-memory size of the resulting DataFrame, its dtypes
+and the per-partition timings of the best read.
+"""
+import argparse
+import json
+import logging
+import resource
+import subprocess
+import sys
+import time
+
+from service.etl.extract import EXTRACT_BACKENDS, TransactionExtractor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(backend: str, partitions: int, after_id: int, repeat: int) -> dict:
+    extractor = TransactionExtractor(backend=backend, partitions=partitions)
+    baseline_rss = peak_rss_mb()
+
+    timings = []
+    partition_timings = None
+    df = None
+    for _ in range(repeat):
+        df = None  # let the previous frame go before timing the next read
+        started = time.perf_counter()
+        df = extractor.extract(after_id=after_id)
+        timings.append(time.perf_counter() - started)
+        if timings[-1] == min(timings):
+            partition_timings = extractor.partition_timings
+
+    best = min(timings)
+    return {
+        "backend": backend,
+        "partitions": partitions,
+        "rows": len(df),
+        "seconds_best": round(best, 4),
+        "seconds_all": [round(t, 4) for t in timings],
+        "rows_per_sec": round(len(df) / best, 1) if best else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 2 ** 20, 1),
+        "dtypes": {column: str(dtype) for column, dtype in df.dtypes.items()},
+        "partition_timings": partition_timings,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TransactionExtractor backends")
+    parser.add_argument("--backends", nargs="+", choices=EXTRACT_BACKENDS, default=list(EXTRACT_BACKENDS))
+    parser.add_argument("--partitions", nargs="+", type=int, default=[1], help="ETL_EXTRACT_PARTITIONS values to try")
+    parser.add_argument("--after-id", type=int, default=0, help="Extract rows past this id")
+    parser.add_argument("--repeat", type=int, default=3, help="Reads per backend; the best is reported")
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--child", choices=EXTRACT_BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        json.dump(run_backend(args.child, args.partitions[0], args.after_id, args.repeat), sys.stdout)
+        return
+
+    results = []
+    for backend in args.backends:
+        for partitions in args.partitions:
+            logging.info(f"Benchmarking {backend} backend with {partitions} partition(s)")
+            completed = subprocess.run(
+                [sys.executable, "-m", "benchmarks.extract_benchmark", "--child", backend,
+                 "--partitions", str(partitions), "--after-id", str(args.after_id), "--repeat", str(args.repeat)],
+                check=True, capture_output=True, text=True,
+            )
+            result = json.loads(completed.stdout)
+            logging.info(f"{backend} x{partitions}: {result['rows_per_sec']} rows/s, peak RSS {result['peak_rss_mb']} MB")
+            results.append(result)
+
+    report = {"after_id": args.after_id, "repeat": args.repeat, "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report written to {args.out}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Times segment assignment from the declarative rules.
+
+    python -m benchmarks.segmentation_benchmark [--sizes 10000 100000 1000000] [--rules path.json]
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from service.etl.segmentation import load_segment_rules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark vectorized RFM segmentation")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--rules", help="Segment rules file (default SEGMENT_RULES_PATH)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rules = load_segment_rules(args.rules)
+    rng = np.random.default_rng(args.seed)
+
+    results = []
+    for n in args.sizes:
+        scores = pd.DataFrame({column: rng.integers(1, 6, n) for column in ("r_score", "f_score", "m_score")})
+        started = time.perf_counter()
+        segments = rules.assign(scores)
+        elapsed = time.perf_counter() - started
+        results.append({
+            "customers": n,
+            "milliseconds": round(1000 * elapsed, 3),
+            "segments": pd.Series(segments).value_counts().to_dict(),
+        })
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -48,8 +48,7 @@ def register_callbacks(app):
             query = """
                 SELECT total_transactions, transaction_volume
                 FROM transaction_metrics
-                ORDER BY id DESC
-                LIMIT 1
+                WHERE id = 1
             """
             
             with get_connection() as conn:
@@ -133,7 +132,7 @@ def register_callbacks(app):
     def update_trends(n, scale):
         try:
             # Validating the scale to prevent SQL injection
-            valid_scales = {"daily", "weekly", "monthly"}
+            valid_scales = {"hourly", "daily", "weekly", "monthly", "quarterly"}
             if scale not in valid_scales:
                 raise ValueError(f"Invalid timescale: {scale}")
             
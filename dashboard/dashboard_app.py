@@ -180,9 +180,11 @@ app.layout = html.Div(style={
         dcc.RadioItems(
             id="timescale-toggle",
             options=[
+                {"label": "Hourly", "value": "hourly"},
                 {"label": "Daily", "value": "daily"},
                 {"label": "Weekly", "value": "weekly"},
                 {"label": "Monthly", "value": "monthly"},
+                {"label": "Quarterly", "value": "quarterly"},
             ],
             value="daily",
             style={'marginBottom': '15px'},
@@ -197,12 +199,12 @@ app.layout = html.Div(style={
     # Intervals with optimized refresh rates
     dcc.Interval(
         id="metrics-interval",
-        interval=60 * 1_000,  # 1 minute (60,000ms)
+        interval=5 * 1_000,  # 5 seconds (5,000ms), live aggregates flush every few seconds
         n_intervals=0
     ),
     dcc.Interval(
         id="heatmap-interval",
-        interval=60 * 60 * 1_000,  # 1 hour (3,600,000ms)
+        interval=60 * 1_000,  # 1 minute (60,000ms)
         n_intervals=0
     ),
     dcc.Interval(
@@ -0,0 +1,97 @@
+import logging
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+CHUNK_ROWS = int(os.getenv("BACKFILL_CHUNK_ROWS", 10000))
+
+# Parse like MpesaRequest.transaction_at / amount_cents on ingest: text that is not a
+# valid date and time (month 13, hour 25, second 60, ...) or an amount that does not fit
+# BIGINT cents gives NULL instead of an error that would abort the chunk
+PARSE_FUNCTIONS_SQL = r"""
+    CREATE OR REPLACE FUNCTION mpesa_parse_trans_time(raw TEXT) RETURNS TIMESTAMP AS $$
+    BEGIN
+        IF raw !~ '^\d{14}$' OR substr(raw, 13, 2)::INTEGER > 59 THEN
+            RETURN NULL;
+        END IF;
+        RETURN make_timestamp(
+            substr(raw, 1, 4)::INTEGER, substr(raw, 5, 2)::INTEGER, substr(raw, 7, 2)::INTEGER,
+            substr(raw, 9, 2)::INTEGER, substr(raw, 11, 2)::INTEGER, substr(raw, 13, 2)::DOUBLE PRECISION
+        );
+    EXCEPTION WHEN data_exception THEN
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql IMMUTABLE;
+
+    CREATE OR REPLACE FUNCTION mpesa_parse_amount_cents(raw TEXT) RETURNS BIGINT AS $$
+    BEGIN
+        IF trim(raw) !~ '^-?\d+(\.\d+)?$' THEN
+            RETURN NULL;
+        END IF;
+        RETURN round(trim(raw)::NUMERIC * 100)::BIGINT;
+    EXCEPTION WHEN data_exception THEN
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql IMMUTABLE;
+"""
+
+# Rows whose text does not parse are left NULL; walking by id guarantees progress past them
+BACKFILL_CHUNK_SQL = r"""
+    WITH chunk AS (
+        SELECT id FROM mpesa_transactions
+        WHERE id > %(after_id)s
+        ORDER BY id
+        LIMIT %(chunk_rows)s
+    ), updated AS (
+        UPDATE mpesa_transactions t
+        SET transaction_at = mpesa_parse_trans_time(t.transaction_time),
+            amount_cents = mpesa_parse_amount_cents(t.transaction_amount)
+        FROM chunk
+        WHERE t.id = chunk.id
+          AND (t.transaction_at IS NULL OR t.amount_cents IS NULL)
+    )
+    SELECT max(id), count(*) FROM chunk
+"""
+
+
+def backfill_typed_columns():
+    """Fills transaction_at / amount_cents for rows ingested before they existed, one chunk per commit."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    conn = psycopg2.connect(
+        dbname=os.getenv("DATABASE_NAME"),
+        user=os.getenv("DATABASE_USER"),
+        password=os.getenv("DATABASE_PASSWORD"),
+        host=os.getenv("DATABASE_HOST", "localhost"),
+        port=int(os.getenv("DATABASE_PORT", 5432)),
+    )
+    cur = conn.cursor()
+
+    with open(os.path.join(base_dir, "tables", "mpesa_transactions.sql"), "r") as f:
+        cur.execute(f.read())
+    cur.execute(PARSE_FUNCTIONS_SQL)
+    conn.commit()
+
+    after_id, scanned = 0, 0
+    while True:
+        cur.execute(BACKFILL_CHUNK_SQL, {"after_id": after_id, "chunk_rows": CHUNK_ROWS})
+        last_id, count = cur.fetchone()
+        conn.commit()
+
+        if not count:
+            break
+        after_id = last_id
+        scanned += count
+        logging.info(f"Backfilled typed columns through id {after_id} ({scanned} rows scanned)")
+
+    cur.close()
+    conn.close()
+    logging.info("Typed column backfill completed.")
+
+backfill_typed_columns()
@@ -17,7 +17,11 @@ def run_sql_scripts():
         os.path.join(base_dir, "tables", "customers.sql"),
         os.path.join(base_dir, "tables", "peak_hours.sql"),
         os.path.join(base_dir, "tables", "transaction_metrics.sql"),
-        os.path.join(base_dir, "tables", "timeseries_trends.sql")
+        os.path.join(base_dir, "tables", "timeseries_trends.sql"),
+        os.path.join(base_dir, "tables", "validation_rules.sql"),
+        os.path.join(base_dir, "tables", "etl_watermarks.sql"),
+        os.path.join(base_dir, "tables", "rfm_sketches.sql"),
+        os.path.join(base_dir, "tables", "etl_batches.sql")
     ]
 
     conn = psycopg2.connect(
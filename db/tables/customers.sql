@@ -20,4 +20,4 @@ ADD COLUMN IF NOT EXISTS m_score NUMERIC(12, 2) NOT NULL DEFAULT 0.00,
 ADD COLUMN IF NOT EXISTS customer_segment TEXT NOT NULL DEFAULT 'unknown';
 
 
--- remove dummy first seen from TransactionTransformer._update_cummulative_metrics, add it in the table
+-- first_seen is the earliest transaction time of the customer, kept by the ETL customer merge
@@ -0,0 +1,10 @@
+-- ETL batches the loader has committed, keyed by pipeline:from_id-last_id.
+-- Inserted in the load transaction, so a retried batch is recognised and skipped.
+CREATE TABLE IF NOT EXISTS etl_batches (
+    batch_id TEXT PRIMARY KEY,
+    pipeline TEXT NOT NULL,
+    from_id BIGINT NOT NULL,
+    last_id BIGINT NOT NULL,
+    timings JSONB,
+    loaded_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
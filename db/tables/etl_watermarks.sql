@@ -0,0 +1,7 @@
+-- Highest mpesa_transactions.id each ETL pipeline has loaded.
+-- Advanced in the same transaction as the load it belongs to.
+CREATE TABLE IF NOT EXISTS etl_watermarks (
+    pipeline TEXT PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
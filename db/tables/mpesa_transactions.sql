@@ -14,3 +14,21 @@ CREATE TABLE IF NOT EXISTS mpesa_transactions (
     middle_name TEXT,
     last_name TEXT
 );
+
+-- Typed copies of transaction_time / transaction_amount, parsed once at ingest.
+-- Existing rows are filled by db/backfill_typed_columns.py
+ALTER TABLE mpesa_transactions
+ADD COLUMN IF NOT EXISTS transaction_at TIMESTAMP,
+ADD COLUMN IF NOT EXISTS amount_cents BIGINT;
+
+CREATE INDEX IF NOT EXISTS mpesa_transactions_transaction_at_idx
+    ON mpesa_transactions (transaction_at);
+
+-- When the row was inserted. The ETL extracts only ids below rows older than its commit
+-- lag, so rows of a transaction still open are not skipped by the watermark. Added
+-- without a default first so existing rows stay NULL (counted as old) without a rewrite.
+ALTER TABLE mpesa_transactions
+ADD COLUMN IF NOT EXISTS inserted_at TIMESTAMPTZ;
+
+ALTER TABLE mpesa_transactions
+ALTER COLUMN inserted_at SET DEFAULT clock_timestamp();
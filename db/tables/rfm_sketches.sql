@@ -0,0 +1,20 @@
+-- KLL quantile sketches of customer recency (last_seen), frequency and monetary values,
+-- one row per metric. The loader rebuilds them from the distinct customers seen in the last
+-- RFM_SKETCH_WINDOW_DAYS days every RFM_SKETCH_REBUILD_MINUTES; they give the global RFM score boundaries.
+
+-- The former per-day layout is dropped; the next rebuild fills the table again
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'rfm_sketches' AND column_name = 'day'
+    ) THEN
+        DROP TABLE rfm_sketches;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS rfm_sketches (
+    metric TEXT PRIMARY KEY CHECK (metric IN ('recency', 'frequency', 'monetary')),
+    sketch JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -15,3 +15,15 @@ CREATE TABLE IF NOT EXISTS monthly_trends (
     total_transactions INTEGER,
     total_amount NUMERIC
 );
+
+CREATE TABLE IF NOT EXISTS hourly_trends (
+    transaction_time TIMESTAMP PRIMARY KEY,
+    total_transactions INTEGER,
+    total_amount NUMERIC
+);
+
+CREATE TABLE IF NOT EXISTS quarterly_trends (
+    transaction_time DATE PRIMARY KEY,
+    total_transactions INTEGER,
+    total_amount NUMERIC
+);
@@ -3,3 +3,16 @@ CREATE TABLE IF NOT EXISTS transaction_metrics (
     total_transactions INTEGER NOT NULL DEFAULT 0,
     transaction_volume NUMERIC(12, 2) NOT NULL DEFAULT 0.00
 );
+
+-- Every writer adds to the single row id = 1 and the dashboard reads it. Rows written
+-- under the former "first/latest row" rules are partial counts, folded into it here.
+WITH extra AS (
+    DELETE FROM transaction_metrics WHERE id <> 1
+    RETURNING total_transactions, transaction_volume
+)
+INSERT INTO transaction_metrics (id, total_transactions, transaction_volume)
+SELECT 1, SUM(total_transactions), SUM(transaction_volume) FROM extra
+HAVING COUNT(*) > 0
+ON CONFLICT (id) DO UPDATE SET
+    total_transactions = transaction_metrics.total_transactions + EXCLUDED.total_transactions,
+    transaction_volume = transaction_metrics.transaction_volume + EXCLUDED.transaction_volume;
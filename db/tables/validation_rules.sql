@@ -0,0 +1,13 @@
+-- Rules enforced by /api/validation. The API reloads them when the row count or
+-- max(updated_at) changes, so set updated_at = NOW() when editing a rule.
+--   blocked_msisdn    value = MSISDN to reject
+--   amount_limit      value = maximum TransAmount for BillRefNumber = account (NULL account = default limit)
+--   bill_ref_pattern  value = regex BillRefNumber must fully match for BusinessShortCode = account (NULL = all)
+CREATE TABLE IF NOT EXISTS validation_rules (
+    id SERIAL PRIMARY KEY,
+    rule_type TEXT NOT NULL CHECK (rule_type IN ('blocked_msisdn', 'amount_limit', 'bill_ref_pattern')),
+    account TEXT,
+    value TEXT NOT NULL,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,272 @@
+"""
+Load generator for the M-Pesa callback endpoints.
+
+    python -m loadtest.mpesa_load --base-url http://localhost:8000 --rps 200 --duration 60 --out run.json
+
+Sends realistic Daraja C2B callbacks (MpesaRequest shape) on an open-loop
+schedule: Poisson arrivals at the target rate with random bursts, Zipf-skewed
+MSISDN popularity and a share of duplicate retries of recent TransIDs. Latency
+is measured from each request's scheduled send time, so a slow server cannot
+hide queueing delay. The JSON report holds latency percentiles and histograms,
+error rates and the mpesa_transactions row counts before and after the run.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import logging
+import os
+import random
+import string
+import sys
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+import httpx
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+FIRST_NAMES = ["John", "Mary", "Peter", "Grace", "Kevin", "Faith", "Brian", "Mercy", "Dennis", "Joy"]
+
+
+class CallbackGenerator:
+    """Builds callback payloads with skewed MSISDN popularity and retried TransIDs."""
+    def __init__(self, customers: int, zipf_s: float, duplicate_rate: float, short_code: str, seed: int = None):
+        self.random = random.Random(seed)
+        self.duplicate_rate = duplicate_rate
+        self.short_code = short_code
+
+        self.msisdns = [f"2547{self.random.randint(0, 99_999_999):08d}" for _ in range(customers)]
+        weights = [1 / rank ** zipf_s for rank in range(1, customers + 1)]
+        self.cumulative_weights = list(itertools.accumulate(weights))
+        self.recent = deque(maxlen=1000)
+
+        self.unique_sent = 0
+        self.duplicates_sent = 0
+
+    def next_payload(self) -> dict:
+        if self.recent and self.random.random() < self.duplicate_rate:
+            self.duplicates_sent += 1
+            return self.random.choice(self.recent)
+
+        msisdn = self.random.choices(self.msisdns, cum_weights=self.cumulative_weights)[0]
+        payload = {
+            "TransactionType": "Pay Bill",
+            "TransID": "".join(self.random.choices(string.ascii_uppercase + string.digits, k=10)),
+            "TransTime": datetime.now().strftime("%Y%m%d%H%M%S"),
+            "TransAmount": f"{min(self.random.lognormvariate(6.5, 1.2), 150_000):.2f}",
+            "BusinessShortCode": self.short_code,
+            "BillRefNumber": f"ACC{self.random.randint(1, 500):04d}",
+            "InvoiceNumber": None,
+            "OrgAccountBalance": f"{self.random.uniform(1e4, 1e7):.2f}",
+            "ThirdPartyTransID": None,
+            "MSISDN": msisdn,
+            "FirstName": self.random.choice(FIRST_NAMES),
+            "MiddleName": None,
+            "LastName": None,
+        }
+        self.recent.append(payload)
+        self.unique_sent += 1
+        return payload
+
+
+class BurstyArrivals:
+    """Poisson arrivals whose rate jumps by burst_factor for burst_seconds at random moments."""
+    def __init__(self, rps: float, burst_factor: float, burst_probability: float, burst_seconds: float, rng: random.Random):
+        self.rps = rps
+        self.burst_factor = burst_factor
+        self.burst_probability = burst_probability
+        self.burst_seconds = burst_seconds
+        self.random = rng
+        self._burst_until = -1.0
+        self._next_burst_check = 0.0
+
+    def next_offset(self, now: float) -> float:
+        # Once per second, decide whether a burst starts
+        while now >= self._next_burst_check:
+            if self.random.random() < self.burst_probability:
+                self._burst_until = self._next_burst_check + self.burst_seconds
+            self._next_burst_check += 1.0
+
+        rate = self.rps * (self.burst_factor if now < self._burst_until else 1.0)
+        return now + self.random.expovariate(rate)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies_ms = []
+        self.status_codes = Counter()
+        self.errors = 0
+
+    def record(self, latency_ms: float, status):
+        self.latencies_ms.append(latency_ms)
+        self.status_codes[str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors += 1
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies_ms)
+        count = len(latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(count - 1, int(p / 100 * count))], 3)
+
+        histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for latency in latencies:
+            histogram[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, latency)] += 1
+
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "error_rate": round(self.errors / count, 6) if count else 0.0,
+            "status_codes": dict(self.status_codes),
+            "latency_ms": {
+                "mean": round(sum(latencies) / count, 3) if count else None,
+                "p50": percentile(50),
+                "p95": percentile(95),
+                "p99": percentile(99),
+                "max": round(latencies[-1], 3) if latencies else None,
+            },
+            "histogram_ms": [
+                {"le": bound, "count": histogram[i]} for i, bound in enumerate(HISTOGRAM_BOUNDS_MS)
+            ] + [{"le": "inf", "count": histogram[-1]}],
+        }
+
+
+def count_transactions():
+    """Row count of mpesa_transactions, or None if the database is unreachable."""
+    try:
+        conn = psycopg2.connect(
+            dbname=os.getenv("DATABASE_NAME"),
+            user=os.getenv("DATABASE_USER"),
+            password=os.getenv("DATABASE_PASSWORD"),
+            host=os.getenv("DATABASE_HOST", "localhost"),
+            port=int(os.getenv("DATABASE_PORT", 5432)),
+        )
+    except psycopg2.Error as e:
+        logging.warning(f"Could not count mpesa_transactions: {e}")
+        return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM mpesa_transactions")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+async def run_load(args) -> dict:
+    rng = random.Random(args.seed)
+    generator = CallbackGenerator(args.customers, args.zipf_s, args.duplicate_rate, args.short_code, seed=args.seed)
+    arrivals = BurstyArrivals(args.rps, args.burst_factor, args.burst_probability, args.burst_seconds, rng)
+    stats = {"confirmation": EndpointStats(), "validation": EndpointStats()}
+
+    rows_before = count_transactions()
+    started_at = datetime.now(timezone.utc).isoformat()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+
+        async def send(endpoint: str, payload: dict, scheduled: float):
+            async with semaphore:
+                try:
+                    response = await client.post(f"/api/{endpoint}", json=payload)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+            stats[endpoint].record(1000 * (time.perf_counter() - scheduled), status)
+
+        async def payment(payload: dict, scheduled: float):
+            # Daraja calls validation (when enabled on the short code) before confirmation
+            if rng.random() < args.validation_ratio:
+                await send("validation", payload, scheduled)
+            await send("confirmation", payload, time.perf_counter())
+
+        tasks = set()
+        started = time.perf_counter()
+        offset = 0.0
+        while True:
+            offset = arrivals.next_offset(offset)
+            if offset >= args.duration:
+                break
+
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            task = asyncio.create_task(payment(generator.next_payload(), started + offset))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    # Give a buffered (write-behind) ingest time to flush before counting
+    await asyncio.sleep(args.settle)
+    rows_after = count_transactions()
+
+    total_requests = sum(len(endpoint.latencies_ms) for endpoint in stats.values())
+    return {
+        "started_at": started_at,
+        "config": vars(args),
+        "duration_s": round(elapsed, 3),
+        "achieved_rps": round(total_requests / elapsed, 3) if elapsed else 0.0,
+        "endpoints": {name: endpoint.report() for name, endpoint in stats.items()},
+        "db": {
+            "rows_before": rows_before,
+            "rows_after": rows_after,
+            "rows_inserted": rows_after - rows_before if rows_before is not None and rows_after is not None else None,
+            "unique_trans_ids_sent": generator.unique_sent,
+            "duplicate_retries_sent": generator.duplicates_sent,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test /api/confirmation and /api/validation")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rps", type=float, default=100, help="Target payments per second outside bursts")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to generate load for")
+    parser.add_argument("--customers", type=int, default=10_000, help="Distinct MSISDNs")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Skew of MSISDN popularity")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Share of callbacks that retry a recent TransID")
+    parser.add_argument("--validation-ratio", type=float, default=1.0, help="Share of payments preceded by a validation call")
+    parser.add_argument("--burst-factor", type=float, default=5.0, help="Rate multiplier during a burst")
+    parser.add_argument("--burst-probability", type=float, default=0.02, help="Chance per second that a burst starts")
+    parser.add_argument("--burst-seconds", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=256, help="Maximum in-flight requests")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds to wait before the final row count")
+    parser.add_argument("--short-code", default="600000")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report written to {args.out}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
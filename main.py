@@ -1,9 +1,19 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from api.routes import router as mpesa_router
+from api.routes import router as mpesa_router, mpesa_api
 from dashboard.dashboard_app import app as dash_app
 from starlette.middleware.wsgi import WSGIMiddleware
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared database pool before serving callbacks
+    await mpesa_api.start()
+    yield
+    await mpesa_api.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Dash (Flask) app at /dashboard
 app.mount("/dashboard", WSGIMiddleware(dash_app.server), name="dashboard")
@@ -1,8 +1,11 @@
 import pykka
 import logging
+import os
 from service.actors.transformer_actor import TransformerActor
 from service.actors.loader_actor import LoaderActor
 from service.etl.extract import TransactionExtractor
+from service.etl.partials import BatchPartials
+from service.etl.transform import trend_granularities, trend_grain
 from service.models.commands import Command
 
 logging.basicConfig(
@@ -14,6 +17,8 @@ class CoordinatorActor(pykka.ThreadingActor):
     def __init__(self):
         super().__init__()
         self.transaction_extractor = TransactionExtractor()
+        self.pipeline = os.getenv("ETL_PIPELINE_NAME", "mpesa_etl_batch")
+        self.streaming = os.getenv("ETL_STREAMING", "false").lower() == "true"
 
         logging.info("CoordinatorActor Spawing child actors ")
         self.transformer_actor = TransformerActor.start()
@@ -24,11 +29,21 @@ class CoordinatorActor(pykka.ThreadingActor):
         try:
             if message.get("command") == Command.RUN_BATCH:
 
-                # Extracting data 
-                raw_data = self.transaction_extractor.extract()
+                # Extracting only the rows added since the last successful load
+                watermark = self.transaction_extractor.get_watermark(self.pipeline)
+                if self.streaming:
+                    transformed_data, last_id = self._transform_streamed(watermark)
+                else:
+                    transformed_data, last_id = self._transform_in_memory(watermark)
 
-                logging.info("CoordinatorActor Sending messages to child actors")
-                transformed_data = self.transformer_actor.ask({"command": Command.TRANSFORM, "data": raw_data})
+                if transformed_data is None:
+                    logging.info(f"No new transactions past watermark {watermark}")
+                    return {"status": "no_new_transactions", "watermark": watermark}
+                if "error" in transformed_data:
+                    return transformed_data
+
+                # The loader advances the watermark in the same transaction as the load; from_id and last_id make the batch id
+                transformed_data["watermark"] = {"pipeline": self.pipeline, "from_id": watermark, "last_id": last_id}
                 result = self.loader_actor.ask({"command": Command.LOAD, "data": transformed_data})
         
                 return result
@@ -36,5 +51,46 @@ class CoordinatorActor(pykka.ThreadingActor):
             logging.error(f"Error in on_receive: {e}", exc_info=True)
             return {"error": str(e)}
 
+    def _transform_in_memory(self, watermark: int):
+        raw_data = self.transaction_extractor.extract(after_id=watermark)
+        if raw_data.empty:
+            return None, watermark
+
+        logging.info(f"CoordinatorActor extracted {len(raw_data)} rows past watermark {watermark}")
+        self._mirror(raw_data, watermark)
+        logging.info("CoordinatorActor Sending messages to child actors")
+        transformed_data = self.transformer_actor.ask({"command": Command.TRANSFORM, "data": raw_data})
+        return transformed_data, int(raw_data["id"].max())
+
+    def _transform_streamed(self, watermark: int):
+        # Chunks are folded into partial aggregates and dropped, bounding memory by the chunk size
+        partials = BatchPartials(bucket_freq=trend_grain(trend_granularities()))
+        for chunk in self.transaction_extractor.extract_chunks(after_id=watermark):
+            partials.update(chunk)
+            self._mirror(chunk, watermark)
+
+        if partials.total_transactions == 0:
+            return None, watermark
+
+        logging.info(f"CoordinatorActor streamed {partials.total_transactions} rows in {partials.chunks} chunks past watermark {watermark}")
+        transformed_data = self.transformer_actor.ask({"command": Command.TRANSFORM_PARTIALS, "data": partials})
+        return transformed_data, partials.max_id
+
 
     
+
+    def _mirror(self, frame, watermark: int):
+        """Appends extracted rows to the local Parquet mirror, if one is configured."""
+        cache = self.transaction_extractor.parquet_cache
+        if cache is None or self.transaction_extractor.source == "parquet":
+            # No mirror, or the batch was read from it
+            return
+
+        # The mirror is a convenience for recomputes: failing to write it must not fail the batch
+        try:
+            if cache.last_id < watermark:
+                # First run with the mirror (or it was wiped): copy the history this batch skips
+                cache.sync(self.transaction_extractor, until_id=watermark)
+            cache.append(frame)
+        except Exception as e:
+            logging.warning(f"Appending to the Parquet mirror failed: {e}", exc_info=True)
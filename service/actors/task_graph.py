@@ -0,0 +1,83 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class TaskGraphError(Exception):
+    pass
+
+
+class TaskGraph:
+    """
+    Runs a small DAG of blocking calls (typically actor asks) concurrently.
+
+    Each node is a callable that receives the results of the nodes it runs
+    after, in order. A node starts as soon as its dependencies have finished,
+    so independent branches overlap and the graph takes as long as its critical
+    path. A node returning {"error": ...} (the actors' failure shape) or raising
+    stops the graph with TaskGraphError. Per-node start/finish offsets and
+    durations are kept in timings.
+    """
+    def __init__(self, name: str = "task_graph"):
+        self.name = name
+        self.nodes = {}
+        self.timings = {}
+        self.wall_seconds = None
+
+    def add(self, name: str, fn, after: tuple = ()) -> "TaskGraph":
+        # Dependencies must already exist, which also rules out cycles
+        missing = [dependency for dependency in after if dependency not in self.nodes]
+        if missing:
+            raise ValueError(f"{self.name}: node {name!r} depends on unknown node(s) {missing}")
+        if name in self.nodes:
+            raise ValueError(f"{self.name}: duplicate node {name!r}")
+
+        self.nodes[name] = (fn, tuple(after))
+        return self
+
+    def run(self) -> dict:
+        results = {}
+        pending = dict(self.nodes)
+        running = {}
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.nodes)), thread_name_prefix=self.name) as pool:
+            while pending or running:
+                for name, (fn, after) in list(pending.items()):
+                    if all(dependency in results for dependency in after):
+                        del pending[name]
+                        future = pool.submit(self._timed, name, fn, [results[dependency] for dependency in after], started)
+                        running[future] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        raise TaskGraphError(f"{self.name}: {name} failed: {e}") from e
+                    if isinstance(result, dict) and "error" in result:
+                        raise TaskGraphError(f"{self.name}: {name} failed: {result['error']}")
+                    results[name] = result
+
+        self.wall_seconds = round(time.perf_counter() - started, 4)
+        busy = sum(timing["seconds"] for timing in self.timings.values())
+        logging.info(f"{self.name} finished in {self.wall_seconds}s ({round(busy, 4)}s of node time): {self.timings}")
+        return results
+
+    def _timed(self, name: str, fn, args: list, graph_started: float):
+        node_started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            finished = time.perf_counter()
+            self.timings[name] = {
+                "start": round(node_started - graph_started, 4),
+                "finish": round(finished - graph_started, 4),
+                "seconds": round(finished - node_started, 4),
+            }
@@ -1,6 +1,8 @@
 import logging
 import pykka
+from service.etl.batch import TransactionBatch
 from service.etl.transform import TransactionTransformer
+from service.actors.task_graph import TaskGraph
 from service.models.commands import Command
 
 import os
@@ -29,26 +31,55 @@ class TransformerActor(pykka.ThreadingActor):
         logging.info(f"TransformerActor received command :: {message['command']}")
         try:
             if message.get("command") == Command.TRANSFORM:
-                raw_data = message["data"]
-
-                # Parse time
-                parsed_data = self.transaction_transformer.parse_time(raw_data)
+                # Derived columns (parsed time, amounts, heatmap cells) are computed once on the batch and shared
+                batch = TransactionBatch(message["data"])
 
                 logging.info("TransformerActor Sending messages to child actors")
-                total_transactions = self.summary_calculator_actor.ask({"command": Command.GET_TOTAL_TRANSACTIONS, "data": parsed_data})
-                transaction_volume = self.summary_calculator_actor.ask({"command": Command.COMPUTE_TRANSACTION_VOLUME, "data": parsed_data})
-                repeat_customers = self.customer_analyser_actor.ask({"command": Command.GET_REPEAT_CUSTOMERS, "data": parsed_data})
-                cltv = self.customer_analyser_actor.ask({"command": Command.COMPUTE_CLTV, "data": repeat_customers})
-                clustered_customers = self.customer_analyser_actor.ask({"command": Command.CLUSTER_CUSTOMERS_FCM, "data": cltv})
-                timeseries_trends = self.temporal_analyzer_actor.ask({"command": Command.COMPUTE_TIMESERIES, "data": parsed_data})
-                activity_heatmap = self.temporal_analyzer_actor.ask({"command": Command.GET_ACTIVITY_HEATMAP, "data": parsed_data})
+                # Summary, temporal and customer work run concurrently; only the customer chain is sequential
+                summary = self.summary_calculator_actor
+                temporal = self.temporal_analyzer_actor
+                customers = self.customer_analyser_actor
+                graph = TaskGraph("transform") \
+                    .add("total_transactions", lambda: summary.ask({"command": Command.GET_TOTAL_TRANSACTIONS, "data": batch})) \
+                    .add("transaction_volume", lambda: summary.ask({"command": Command.COMPUTE_TRANSACTION_VOLUME, "data": batch})) \
+                    .add("timeseries_trends", lambda: temporal.ask({"command": Command.COMPUTE_TIMESERIES, "data": batch})) \
+                    .add("activity_heatmap", lambda: temporal.ask({"command": Command.GET_ACTIVITY_HEATMAP, "data": batch})) \
+                    .add("repeat_customers", lambda: customers.ask({"command": Command.GET_REPEAT_CUSTOMERS, "data": batch})) \
+                    .add("cltv", lambda repeat: customers.ask({"command": Command.COMPUTE_CLTV, "data": repeat}), after=("repeat_customers",)) \
+                    .add("customers", lambda cltv: customers.ask({"command": Command.CLUSTER_CUSTOMERS_FCM, "data": cltv}), after=("cltv",))
+                results = graph.run()
+
+                return {
+                    "total_transactions": results["total_transactions"],
+                    "transaction_volume": results["transaction_volume"],
+                    "customers": results["customers"],
+                    "timeseries_trends": results["timeseries_trends"],
+                    "activity_heatmap": results["activity_heatmap"],
+                    "transform_timings": graph.timings,
+                }
+
+            elif message.get("command") == Command.TRANSFORM_PARTIALS:
+                # Streamed batch: summaries, trends and heatmap are already aggregated per chunk
+                partials = message["data"]
+
+                logging.info("TransformerActor Sending customer partials to child actors")
+                customers = self.customer_analyser_actor
+                transformer = self.transaction_transformer
+                graph = TaskGraph("transform_partials") \
+                    .add("timeseries_trends", lambda: transformer.rollup_trends(partials.buckets())) \
+                    .add("activity_heatmap", lambda: transformer.peak_hours_from_counts(partials.heatmap_counts())) \
+                    .add("repeat_customers", lambda: customers.ask({"command": Command.MERGE_CUSTOMERS, "data": partials.customers()})) \
+                    .add("cltv", lambda repeat: customers.ask({"command": Command.COMPUTE_CLTV, "data": repeat}), after=("repeat_customers",)) \
+                    .add("customers", lambda cltv: customers.ask({"command": Command.CLUSTER_CUSTOMERS_FCM, "data": cltv}), after=("cltv",))
+                results = graph.run()
 
                 return {
-                    "total_transactions": total_transactions,
-                    "transaction_volume": transaction_volume,
-                    "customers": clustered_customers,
-                    "timeseries_trends": timeseries_trends,
-                    "activity_heatmap": activity_heatmap
+                    "total_transactions": partials.total_transactions,
+                    "transaction_volume": round(partials.transaction_volume, 2),
+                    "customers": results["customers"],
+                    "timeseries_trends": results["timeseries_trends"],
+                    "activity_heatmap": results["activity_heatmap"],
+                    "transform_timings": graph.timings,
                 }
         except Exception as e:
             logging.error(f"Error in on_receive: {e}", exc_info=True)
@@ -27,6 +27,8 @@ class CustomerAnalyserActor(pykka.ThreadingActor):
         try:
             if command == Command.GET_REPEAT_CUSTOMERS:
                 return self.transaction_transformer.get_repeat_customers(data)
+            elif command == Command.MERGE_CUSTOMERS:
+                return self.transaction_transformer.merge_customers(data)
             elif command == Command.COMPUTE_CLTV:
                 return self.transaction_transformer.predict_customer_lifetime_value(data)
             elif command == Command.CLUSTER_CUSTOMERS_FCM:
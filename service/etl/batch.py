@@ -0,0 +1,109 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from service.etl.kernels import HEATMAP_HOURS, heatmap_codes
+
+# transaction_time as the raw API payload carries it
+TIME_FORMAT = '%Y%m%d%H%M%S'
+
+
+class TransactionBatch:
+    """
+    One extracted batch of transactions, shared read-only by every transformer.
+
+    The extracted frame is never modified. Derived columns (parsed times,
+    numeric amounts, hour, weekday, heatmap cell codes) are computed on first
+    access and cached, each exactly once even when several actors ask for it
+    at the same time, so the batch is parsed once however many transformers
+    read it. Derived NumPy arrays are marked read-only; Series and the frame
+    are shared as well and must be treated as such.
+    """
+    def __init__(self, df: DataFrame):
+        self._df = df
+        self._cache = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    @classmethod
+    def of(cls, data) -> "TransactionBatch":
+        """data itself when it is already a batch, otherwise a new batch around the frame."""
+        return data if isinstance(data, cls) else cls(data)
+
+    def __len__(self) -> int:
+        return len(self._df)
+
+    @property
+    def frame(self) -> DataFrame:
+        return self._df
+
+    @property
+    def empty(self) -> bool:
+        return self._df.empty
+
+    def column(self, name: str) -> pd.Series:
+        return self._df[name]
+
+    @property
+    def times(self) -> pd.Series:
+        """transaction_time as datetime64 (already typed from the extractor; raw text is parsed)."""
+        return self._cached('times', self._parse_times)
+
+    @property
+    def amounts(self) -> pd.Series:
+        """transaction_amount as numbers; unparseable values are NaN."""
+        return self._cached('amounts', self._parse_amounts)
+
+    @property
+    def cell_codes(self) -> tuple[np.ndarray, np.ndarray]:
+        """(dayofweek * 24 + hour of the non-null times, mask of those rows), as kernels.heatmap_codes returns."""
+        return self._cached('cell_codes', lambda: self._readonly(*heatmap_codes(self.times)))
+
+    @property
+    def hours(self) -> np.ndarray:
+        """Hour of day per row, -1 where the time is missing."""
+        return self._cached('hours', lambda: self._from_cells(lambda cells: cells % HEATMAP_HOURS))
+
+    @property
+    def weekdays(self) -> np.ndarray:
+        """Day of week per row (Monday = 0), -1 where the time is missing."""
+        return self._cached('weekdays', lambda: self._from_cells(lambda cells: cells // HEATMAP_HOURS))
+
+    def _cached(self, name: str, compute):
+        if name in self._cache:
+            return self._cache[name]
+
+        # One lock per derived column: different columns are computed concurrently,
+        # the same column only once. Derivations may read other derived columns.
+        with self._locks_guard:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._cache:
+                self._cache[name] = compute()
+            return self._cache[name]
+
+    def _parse_times(self) -> pd.Series:
+        times = self._df['transaction_time']
+        if not pd.api.types.is_datetime64_any_dtype(times):
+            times = pd.to_datetime(times, format=TIME_FORMAT)
+        return times
+
+    def _parse_amounts(self) -> pd.Series:
+        amounts = self._df['transaction_amount']
+        if not pd.api.types.is_numeric_dtype(amounts):
+            amounts = pd.to_numeric(amounts, errors='coerce')
+        return amounts
+
+    def _from_cells(self, derive) -> np.ndarray:
+        codes, valid = self.cell_codes
+        values = np.full(len(self._df), -1, dtype=np.int8)
+        values[valid] = derive(codes)
+        return self._readonly(values)[0]
+
+    @staticmethod
+    def _readonly(*arrays: np.ndarray) -> tuple:
+        for array in arrays:
+            array.flags.writeable = False
+        return arrays
@@ -0,0 +1,90 @@
+import io
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from pandas import DataFrame
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def quote(identifier) -> str:
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def copy_frame(cursor, table: str, df: DataFrame, columns: list) -> int:
+    """COPYs the given columns of df into table in one round trip. Returns the number of rows."""
+    buffer = io.StringIO()
+    # Missing values are written as empty fields, which COPY reads as NULL
+    df[columns].to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(quote(column) for column in columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return len(df)
+
+
+class BulkWriter:
+    """
+    Set-based writes for the loader, on the caller's cursor and transaction.
+
+    Rows go to a temp staging table with COPY, batch_rows at a time, and each
+    batch is applied to its table with one statement, so a table costs a few
+    round trips however many rows it has. Rows written and rows/s are logged
+    and kept per table in stats.
+    """
+    def __init__(self, cursor, batch_rows: int = None):
+        self.cursor = cursor
+        self.batch_rows = max(1, int(batch_rows or os.getenv("ETL_LOAD_BATCH_ROWS", 50_000)))
+        self.stats = {}
+
+    def upsert(self, table: str, df: DataFrame, key: list, additive: list = (), replace: list = ()) -> int:
+        """
+        Inserts df's rows into table; on a key conflict additive columns are added
+        to the stored values and replace columns overwrite them.
+        """
+        columns = list(key) + list(additive) + list(replace)
+        updates = [f"{quote(column)} = {table}.{quote(column)} + EXCLUDED.{quote(column)}" for column in additive] \
+            + [f"{quote(column)} = EXCLUDED.{quote(column)}" for column in replace]
+        staging = f"{table}_staging"
+        statement = f"""
+            INSERT INTO {table} ({', '.join(quote(column) for column in columns)})
+            SELECT {', '.join(quote(column) for column in columns)} FROM {staging}
+            ON CONFLICT ({', '.join(quote(column) for column in key)}) DO
+        """ + (f"UPDATE SET {', '.join(updates)}" if updates else "NOTHING")
+
+        return self.merge(
+            table, df, columns, statement,
+            staging=staging,
+            staging_ddl=f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP",
+        )
+
+    def merge(self, table: str, df: DataFrame, columns: list, statement: str, staging: str, staging_ddl: str) -> int:
+        """
+        Stages df's columns in batches and runs statement (which reads staging)
+        after each one. staging_ddl must create the staging table if it is
+        missing and drop it on commit.
+        """
+        with self.timed(table) as counter:
+            for start in range(0, len(df), self.batch_rows):
+                self.cursor.execute(staging_ddl)
+                self.cursor.execute(f"TRUNCATE {staging}")
+                copy_frame(self.cursor, staging, df.iloc[start:start + self.batch_rows], columns)
+                self.cursor.execute(statement)
+                counter["rows"] += min(self.batch_rows, len(df) - start)
+        return counter["rows"]
+
+    @contextmanager
+    def timed(self, table: str, rows: int = 0):
+        """Times the writes to table made inside the block; the block may add to counter["rows"]."""
+        counter = {"rows": rows}
+        started = time.perf_counter()
+        yield counter
+        seconds = time.perf_counter() - started
+
+        stats = self.stats.setdefault(table, {"rows": 0, "seconds": 0.0})
+        stats["rows"] += counter["rows"]
+        stats["seconds"] = round(stats["seconds"] + seconds, 4)
+        logging.info(f"Wrote {counter['rows']} rows to {table} in {seconds:.3f}s ({counter['rows'] / max(seconds, 1e-9):.0f} rows/s)")
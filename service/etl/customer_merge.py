@@ -0,0 +1,123 @@
+from pandas import DataFrame
+
+from service.etl.bulk_writer import BulkWriter, copy_frame
+
+# Cumulative columns of customers maintained by the merge
+CUSTOMER_COLUMNS = [
+    'msisdn', 'total_transactions', 'total_spend', 'avg_spend', 'first_seen', 'last_seen',
+    'days_since_last', 'is_churned', 'churn_score', 'loyalty_score',
+]
+
+# Scores computed by the transformer from the merged customers, stored as they are
+SCORE_COLUMNS = ['clv', 'r_score', 'f_score', 'm_score', 'customer_segment']
+
+# A batch's per-MSISDN partials travel with the merged customers under these names,
+# so the loader can add them to the stored totals
+BATCH_COLUMNS = {
+    'total_transactions': 'batch_transactions',
+    'total_spend': 'batch_spend',
+    'first_seen': 'batch_first_seen',
+    'last_seen': 'batch_last_seen',
+}
+
+PARTIAL_COLUMNS = ['msisdn', 'total_transactions', 'total_spend', 'first_seen', 'last_seen']
+
+STAGING_TABLE = "customer_partials"
+
+STAGING_DDL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+        msisdn TEXT PRIMARY KEY,
+        total_transactions INTEGER NOT NULL,
+        total_spend NUMERIC(12, 2) NOT NULL,
+        first_seen TIMESTAMP,
+        last_seen TIMESTAMP,
+        clv NUMERIC(12, 2),
+        r_score INTEGER,
+        f_score INTEGER,
+        m_score NUMERIC(12, 2),
+        customer_segment TEXT
+    ) ON COMMIT DROP
+"""
+
+
+def dated_partials(grouped: DataFrame) -> DataFrame:
+    """
+    The per-MSISDN partials that can be merged: customers.first_seen and
+    last_seen are NOT NULL, so a customer with no known transaction time
+    in the batch (every TransTime unparseable) is left out.
+    """
+    return grouped.dropna(subset=['msisdn', 'last_seen'])
+
+
+def merged_customers_sql(passthrough: dict = None) -> str:
+    """
+    Staged partials folded into the stored customers: cumulative totals, average
+    spend, first and last seen, and churn and loyalty as
+    customer_state.score_churn computes them. passthrough maps output columns to
+    staging expressions (alias s) carried along unchanged.
+    """
+    passthrough = passthrough or {}
+    carried = "".join(f",\n                {expression} AS {alias}" for alias, expression in passthrough.items())
+    selected = "".join(f", {alias}" for alias in passthrough)
+    return f"""
+        WITH merged AS (
+            SELECT s.msisdn,
+                COALESCE(c.total_transactions, 0) + s.total_transactions AS total_transactions,
+                COALESCE(c.total_spend, 0) + s.total_spend AS total_spend,
+                LEAST(c.first_seen, s.first_seen, s.last_seen) AS first_seen,
+                GREATEST(c.last_seen, s.last_seen) AS last_seen{carried}
+            FROM {STAGING_TABLE} s
+            LEFT JOIN customers c USING (msisdn)
+        ), aged AS (
+            SELECT merged.*,
+                FLOOR(EXTRACT(EPOCH FROM LOCALTIMESTAMP - last_seen) / 86400)::INTEGER AS days_since_last,
+                LEAST(GREATEST(FLOOR(EXTRACT(EPOCH FROM LOCALTIMESTAMP - last_seen) / 86400) / 60.0, 0), 1) AS churn_score
+            FROM merged
+        )
+        SELECT msisdn, total_transactions,
+            total_spend::DOUBLE PRECISION AS total_spend,
+            (total_spend / NULLIF(total_transactions, 0))::DOUBLE PRECISION AS avg_spend,
+            first_seen, last_seen, days_since_last,
+            days_since_last > 30 AS is_churned,
+            churn_score::DOUBLE PRECISION AS churn_score,
+            (LN(1 + total_transactions) * (1 - churn_score))::DOUBLE PRECISION AS loyalty_score{selected}
+        FROM aged
+    """
+
+
+def preview_customer_merge(cursor, grouped: DataFrame) -> DataFrame:
+    """
+    The batch's customers with cumulative metrics, computed by Postgres in one
+    statement over the staged partials. Nothing is written: the loader applies
+    the same merge in its own transaction. The batch partials are returned
+    alongside under the BATCH_COLUMNS names.
+    """
+    cursor.execute(STAGING_DDL)
+    copy_frame(cursor, STAGING_TABLE, dated_partials(grouped), PARTIAL_COLUMNS)
+    batch = {alias: f"s.{column}" for column, alias in BATCH_COLUMNS.items()}
+    batch['batch_spend'] = "s.total_spend::DOUBLE PRECISION"
+    cursor.execute(merged_customers_sql(batch) + " ORDER BY loyalty_score DESC")
+    return DataFrame(cursor.fetchall(), columns=[column.name for column in cursor.description])
+
+
+def upsert_customer_merge(writer: BulkWriter, df: DataFrame) -> int:
+    """
+    Adds the batch partials of df (BATCH_COLUMNS) to the stored customers and
+    stores its scores: per staged batch, one set-based INSERT ... ON CONFLICT.
+    The affected customers are locked first so totals cannot be lost to a
+    concurrent merge. Returns the number of customers written.
+    """
+    partials = df[['msisdn', *BATCH_COLUMNS.values(), *SCORE_COLUMNS]] \
+        .rename(columns={alias: column for column, alias in BATCH_COLUMNS.items()})
+
+    columns = CUSTOMER_COLUMNS + SCORE_COLUMNS
+    updates = ",\n            ".join(f"{column} = EXCLUDED.{column}" for column in columns[1:])
+    statement = f"""
+        SELECT 1 FROM customers c JOIN {STAGING_TABLE} s USING (msisdn) ORDER BY c.msisdn FOR UPDATE OF c;
+        INSERT INTO customers ({', '.join(columns)})
+        {merged_customers_sql({column: f"s.{column}" for column in SCORE_COLUMNS})}
+        ON CONFLICT (msisdn) DO UPDATE SET
+            {updates}
+    """
+    return writer.merge("customers", partials, PARTIAL_COLUMNS + SCORE_COLUMNS, statement,
+                        staging=STAGING_TABLE, staging_ddl=STAGING_DDL)
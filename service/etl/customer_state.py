@@ -0,0 +1,247 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import text
+
+from service.etl.customer_merge import BATCH_COLUMNS, CUSTOMER_COLUMNS, dated_partials
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+CUSTOMER_STATE_BACKENDS = ("database", "resident")
+
+# Rough resident cost of one customer: the five array slots plus the msisdn string and its dict entry
+ROW_BYTES = 200
+
+NAT = np.iinfo(np.int64).min
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def customer_state_backend() -> str:
+    backend = os.getenv("CUSTOMER_STATE_BACKEND", "database")
+    if backend not in CUSTOMER_STATE_BACKENDS:
+        raise ValueError(f"Unknown CUSTOMER_STATE_BACKEND {backend!r}, expected one of {CUSTOMER_STATE_BACKENDS}")
+    return backend
+
+
+def get_customer_state(db_engine) -> "CustomerStateStore":
+    """The one resident store of this process, created on first use and shared by every transformer."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CustomerStateStore(db_engine)
+        return _store
+
+
+def resident_customer_state():
+    """The resident store if this process has one, else None."""
+    return _store
+
+
+def score_churn(df: DataFrame, now: pd.Timestamp = None) -> DataFrame:
+    """days_since_last, is_churned, churn_score and loyalty_score from the cumulative columns."""
+    now = now or pd.Timestamp.now()
+    df['days_since_last'] = (now - df['last_seen']).dt.days
+    df['is_churned'] = df['days_since_last'] > 30
+    df['churn_score'] = (df['days_since_last'] / 60.0).clip(0, 1)
+    df['loyalty_score'] = np.log1p(df['total_transactions']) * (1 - df['churn_score'])
+    return df
+
+
+class CustomerStateStore:
+    """
+    Cumulative customer metrics held in the ETL process.
+
+    msisdns map to row numbers; total_transactions, total_spend, first_seen and
+    last_seen live in NumPy arrays. A batch is merged with one gather and a
+    few vectorized adds over its rows, instead of a customers query with every
+    MSISDN of the batch. The store warms from the customers table on first use,
+    most recently seen customers first. Only customers that are neither
+    resident nor known to be new are looked up.
+
+    Postgres stays the source of truth: the loader adds the batch partials to
+    the customers table (the same totals) and then confirms the merge. A merge that is never
+    confirmed (the batch failed after merging and will be extracted again) has
+    its customers evicted before the next merge, so they are read back from
+    the table instead of being counted twice. When the store outgrows
+    CUSTOMER_STATE_MAX_MB the least recently merged customers are evicted.
+    """
+    ARRAYS = ('msisdns', 'total_transactions', 'total_spend', 'first_seen', 'last_seen', 'last_used')
+
+    def __init__(self, db_engine, max_mb: int = None):
+        self.db_engine = db_engine
+        self.max_rows = max(1, int(max_mb or os.getenv("CUSTOMER_STATE_MAX_MB", 256)) * 1024 * 1024 // ROW_BYTES)
+
+        self.lock = threading.Lock()
+        self.index = {}
+        self.rows = 0
+        # Every customer in the table is resident, so a miss is a new customer
+        self.complete = False
+        self.warmed = False
+        self.merges = 0
+        # MSISDNs of the last merge until the loader has stored it
+        self.pending = None
+        self._allocate(1024)
+
+    def _allocate(self, capacity: int):
+        self.msisdns = np.empty(capacity, dtype=object)
+        self.total_transactions = np.zeros(capacity, dtype=np.int64)
+        self.total_spend = np.zeros(capacity, dtype=np.float64)
+        self.first_seen = np.full(capacity, NAT, dtype=np.int64)
+        self.last_seen = np.full(capacity, NAT, dtype=np.int64)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+
+    def merge(self, grouped: DataFrame) -> DataFrame:
+        """
+        Folds a batch's per-MSISDN metrics (group_customers' shape, optionally
+        with first_seen) into the resident totals and returns every batch
+        customer with cumulative and churn metrics and its batch partials, as
+        customer_merge.preview_customer_merge does.
+        """
+        with self.lock:
+            if not self.warmed:
+                self._warm()
+            if self.pending is not None:
+                logging.warning(f"Previous customer merge was not stored; evicting its {len(self.pending)} customers")
+                self._drop(self.pending)
+
+            grouped = dated_partials(grouped)
+            msisdns = grouped['msisdn'].astype(str).to_numpy()
+            last_seen = self._micros(grouped['last_seen'])
+            first_seen = self._micros(grouped['first_seen']) if 'first_seen' in grouped else last_seen
+
+            misses = [msisdn for msisdn in msisdns if msisdn not in self.index]
+            if misses and not self.complete:
+                self._load(self._fetch(misses))
+
+            # Customers still unknown are new: they start from zero totals
+            for msisdn in msisdns:
+                if msisdn not in self.index:
+                    self._append(msisdn, 0, 0.0, NAT, NAT)
+
+            self.merges += 1
+            rows = np.fromiter((self.index[msisdn] for msisdn in msisdns), dtype=np.int64, count=len(msisdns))
+            self.total_transactions[rows] += grouped['total_transactions'].to_numpy(dtype=np.int64)
+            self.total_spend[rows] += grouped['total_spend'].to_numpy(dtype=np.float64)
+            self.first_seen[rows] = np.where(self.first_seen[rows] == NAT, first_seen, np.minimum(self.first_seen[rows], first_seen))
+            self.last_seen[rows] = np.maximum(self.last_seen[rows], last_seen)
+            self.last_used[rows] = self.merges
+            self.pending = msisdns
+
+            merged = DataFrame({
+                'msisdn': msisdns,
+                'total_transactions': self.total_transactions[rows],
+                'total_spend': self.total_spend[rows],
+                'first_seen': self.first_seen[rows].view('datetime64[us]'),
+                'last_seen': self.last_seen[rows].view('datetime64[us]'),
+                # The loader adds these partials to the stored totals
+                BATCH_COLUMNS['total_transactions']: grouped['total_transactions'].to_numpy(),
+                BATCH_COLUMNS['total_spend']: grouped['total_spend'].to_numpy(dtype=np.float64),
+                BATCH_COLUMNS['first_seen']: first_seen.view('datetime64[us]'),
+                BATCH_COLUMNS['last_seen']: last_seen.view('datetime64[us]'),
+            })
+
+            if self.rows > self.max_rows:
+                self._evict(self.rows - int(self.max_rows * 0.9))
+
+        merged['avg_spend'] = merged['total_spend'] / merged['total_transactions']
+        merged = score_churn(merged)
+        return merged[CUSTOMER_COLUMNS + list(BATCH_COLUMNS.values())].sort_values(by='loyalty_score', ascending=False)
+
+    def confirm(self):
+        """Called once the last merge's customers are committed to the customers table."""
+        with self.lock:
+            self.pending = None
+
+    def _drop(self, msisdns):
+        # Dropped customers are read from the customers table again when next seen
+        drop = np.zeros(self.rows, dtype=bool)
+        for msisdn in msisdns:
+            row = self.index.get(msisdn)
+            if row is not None:
+                drop[row] = True
+        if drop.any():
+            self._compact(~drop)
+            self.complete = False
+        self.pending = None
+
+    def _warm(self):
+        query = text("""
+            SELECT msisdn, total_transactions, total_spend, first_seen, last_seen
+            FROM customers
+            ORDER BY last_seen DESC
+            LIMIT :limit
+        """)
+        with self.db_engine.connect() as conn:
+            warm = pd.read_sql_query(query, conn, params={"limit": self.max_rows + 1})
+
+        self.complete = len(warm) <= self.max_rows
+        self._load(warm.head(self.max_rows))
+        self.warmed = True
+        logging.info(f"Warmed resident customer state with {self.rows} customers ({'all' if self.complete else 'most recent'})")
+
+    def _fetch(self, msisdns: list) -> DataFrame:
+        query = text("""
+            SELECT msisdn, total_transactions, total_spend, first_seen, last_seen
+            FROM customers
+            WHERE msisdn = ANY(:msisdns)
+        """)
+        with self.db_engine.connect() as conn:
+            return pd.read_sql_query(query, conn, params={"msisdns": msisdns})
+
+    def _load(self, df: DataFrame):
+        first_seen = self._micros(df['first_seen'])
+        last_seen = self._micros(df['last_seen'])
+        for i, (msisdn, transactions, spend) in enumerate(zip(df['msisdn'], df['total_transactions'], df['total_spend'])):
+            self._append(str(msisdn), int(transactions), float(spend), first_seen[i], last_seen[i])
+
+    def _append(self, msisdn: str, transactions: int, spend: float, first_seen: int, last_seen: int):
+        if self.rows == len(self.msisdns):
+            self._grow(2 * len(self.msisdns))
+        row = self.rows
+        self.index[msisdn] = row
+        self.msisdns[row] = msisdn
+        self.total_transactions[row] = transactions
+        self.total_spend[row] = spend
+        self.first_seen[row] = first_seen
+        self.last_seen[row] = last_seen
+        self.last_used[row] = self.merges
+        self.rows += 1
+
+    def _grow(self, capacity: int):
+        old = {name: getattr(self, name) for name in self.ARRAYS}
+        self._allocate(capacity)
+        for name, array in old.items():
+            getattr(self, name)[:self.rows] = array[:self.rows]
+
+    def _evict(self, count: int):
+        # Least recently merged first; a batch's own customers were just touched and go last
+        order = np.argsort(self.last_used[:self.rows], kind='stable')
+        keep = np.ones(self.rows, dtype=bool)
+        keep[order[:count]] = False
+        self._compact(keep)
+        self.complete = False
+        logging.info(f"Evicted {count} least recently used customers from the resident state")
+
+    def _compact(self, keep: np.ndarray):
+        kept_rows = int(keep.sum())
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            array[:kept_rows] = array[:self.rows][keep]
+        # Release the evicted strings
+        self.msisdns[kept_rows:self.rows] = None
+        self.rows = kept_rows
+        self.index = {msisdn: row for row, msisdn in enumerate(self.msisdns[:self.rows])}
+
+    @staticmethod
+    def _micros(times: pd.Series) -> np.ndarray:
+        """Timestamps as int64 microseconds, NaT as NAT."""
+        return pd.to_datetime(times).to_numpy(dtype='datetime64[us]').view(np.int64)
@@ -1,30 +1,345 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
+import io
+import logging
 import os
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    from service.etl.parquet_cache import TransactionParquetCache
+except ImportError:  # the copy backend falls back to pandas' CSV parser; the Parquet mirror needs pyarrow
+    pa = None
+    TransactionParquetCache = None
 
 load_dotenv()
 
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+# Typed columns are exposed under the names the transformers already use
+TRANSACTION_SELECT = """
+    id,
+    transaction_type,
+    transaction_id,
+    transaction_at AS transaction_time,
+    amount_cents::float8 / 100 AS transaction_amount,
+    business_short_code,
+    bill_ref_number,
+    invoice_number,
+    org_account_balance,
+    third_party_tansaaction_id,
+    msisdn,
+    first_name,
+    middle_name,
+    last_name
+"""
+
+# Only what the transformers read; amounts stay integer cents on the wire
+COPY_SELECT = """
+    id,
+    transaction_id,
+    msisdn,
+    transaction_at AS transaction_time,
+    amount_cents
+"""
+
+EXTRACT_BACKENDS = ("sql", "copy")
+
+# "database" reads mpesa_transactions; "parquet" reads the local mirror (ETL_PARQUET_CACHE_DIR) for recomputes
+EXTRACT_SOURCES = ("database", "parquet")
+
+# Ids come from a sequence at INSERT, but rows become visible at COMMIT, so a
+# transaction still open can hold ids below rows already visible. Extracts stop at
+# the highest id inserted before both the commit lag and the start of the oldest
+# other transaction that may be inserting; later ids wait for the next run.
+SAFE_UNTIL_ID_SQL = """
+    SELECT max(id) FROM mpesa_transactions
+    WHERE inserted_at IS NULL OR inserted_at < LEAST(
+        clock_timestamp() - make_interval(secs => :lag_seconds),
+        COALESCE((
+            SELECT min(xact_start) FROM pg_stat_activity
+            WHERE datname = current_database()
+              AND pid <> pg_backend_pid()
+              AND (backend_xid IS NOT NULL OR state = 'active')
+        ), 'infinity')
+    )
+"""
+
 class TransactionExtractor:
-    def __init__(self):
+    def __init__(self, backend: str = None, partitions: int = None, source: str = None):
         self.dbname = os.getenv("DATABASE_NAME")
         self.user = os.getenv("DATABASE_USER")
         self.password = os.getenv("DATABASE_PASSWORD")
         self.host = os.getenv("DATABASE_HOST", "localhost")
         self.port = int(os.getenv("DATABASE_PORT", 5432))
+        self.chunk_size = int(os.getenv("ETL_CHUNK_ROWS", 50_000))
+        self.backend = backend or os.getenv("ETL_EXTRACT_BACKEND", "sql")
+        if self.backend not in EXTRACT_BACKENDS:
+            raise ValueError(f"Unknown ETL_EXTRACT_BACKEND {self.backend!r}, expected one of {EXTRACT_BACKENDS}")
+        self.partitions = max(1, int(partitions or os.getenv("ETL_EXTRACT_PARTITIONS", 1)))
+        self.commit_lag_seconds = float(os.getenv("ETL_COMMIT_LAG_SECONDS", 5))
         self.engine = self.create_engine()
+        self.parquet_cache = None
+        if os.getenv("ETL_PARQUET_CACHE_DIR"):
+            if TransactionParquetCache is None:
+                raise ValueError("ETL_PARQUET_CACHE_DIR is set but pyarrow is not installed")
+            self.parquet_cache = TransactionParquetCache()
+        self.source = source or os.getenv("ETL_EXTRACT_SOURCE", "database")
+        if self.source not in EXTRACT_SOURCES:
+            raise ValueError(f"Unknown ETL_EXTRACT_SOURCE {self.source!r}, expected one of {EXTRACT_SOURCES}")
+        if self.source == "parquet" and self.parquet_cache is None:
+            raise ValueError("ETL_EXTRACT_SOURCE=parquet needs ETL_PARQUET_CACHE_DIR")
+
+        # Per-partition timings of the last extract(), for tuning ETL_EXTRACT_PARTITIONS
+        self.partition_timings = []
 
     def create_engine(self):
         db_url = f"postgresql+psycopg2://{self.user}:{self.password}@{self.host}:{self.port}/{self.dbname}"
-        return create_engine(db_url)
+        # One pooled connection per partition so parallel reads never queue on the pool
+        return create_engine(db_url, pool_size=max(5, self.partitions))
+
+    def extract(self, since: str = None, after_id: int = None) -> pd.DataFrame:
+        """
+        Reads transactions with transaction_time as datetime64 and transaction_amount
+        as float, taken from the typed columns filled at ingest, so the transformers
+        never re-parse text. after_id restricts the read to rows past a watermark;
+        rows too recent to be safe behind one (see safe_until_id) are left for
+        the next run. With ETL_EXTRACT_PARTITIONS > 1 the id range is read in parallel.
+        With ETL_EXTRACT_SOURCE=parquet the rows come from the mirror instead.
+        """
+        if self.source == "parquet":
+            return self.extract_cached(since=since, after_id=after_id)
+
+        until_id = self.safe_until_id()
+        if self.partitions > 1:
+            return self._extract_partitioned(since, after_id, until_id)
+        return self._extract_whole(since, after_id, until_id)
+
+    def extract_cached(self, since: str = None, until: str = None, after_id: int = None, columns: list = None) -> pd.DataFrame:
+        """
+        Reads from the local Parquet mirror instead of Postgres, for recomputes
+        over history. Day partitions outside since/until are skipped and the
+        remaining filters are pushed into the Parquet scan.
+        """
+        if self.parquet_cache is None:
+            raise ValueError("ETL_PARQUET_CACHE_DIR is not set, there is no Parquet mirror to read")
+        return self.parquet_cache.read(since=since, until=until, after_id=after_id, columns=columns)
+
+    def extract_chunks(self, since: str = None, after_id: int = None, chunk_size: int = None, until_id: int = None):
+        """
+        Yields the same rows as extract() in DataFrames of at most chunk_size rows,
+        read through a server-side cursor so only one chunk is held at a time.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        if self.source == "parquet":
+            yield from self.parquet_cache.read_batches(since=since, after_id=after_id, batch_rows=chunk_size)
+            return
+
+        safe_id = self.safe_until_id()
+        until_id = safe_id if until_id is None else min(until_id, safe_id)
+        if self.backend == "copy":
+            yield from self._extract_copy_chunks(since, after_id, chunk_size, until_id)
+            return
+
+        query, params = self._build_query(since, after_id, until_id)
+
+        with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as conn:
+            for chunk in pd.read_sql_query(text(query), conn, params=params, chunksize=chunk_size):
+                yield chunk
+
+    def safe_until_id(self) -> int:
+        """
+        Highest id every earlier id of which is committed or never will be: inserted
+        more than ETL_COMMIT_LAG_SECONDS ago and before any other open writing
+        transaction began. 0 when no row qualifies yet.
+        """
+        with self.engine.connect() as conn:
+            until_id = conn.execute(text(SAFE_UNTIL_ID_SQL), {"lag_seconds": self.commit_lag_seconds}).scalar()
+        return until_id or 0
+
+    def _extract_whole(self, since: str = None, after_id: int = None, until_id: int = None) -> pd.DataFrame:
+        started = time.perf_counter()
+        if self.backend == "copy":
+            df = self._copy_frame([self._copy_part(since, after_id, until_id)])
+        else:
+            query, params = self._build_query(since, after_id, until_id)
+            df = pd.read_sql_query(text(query), self.engine, params=params)
+
+        self.partition_timings = [{"partition": 0, "rows": len(df), "seconds": round(time.perf_counter() - started, 4)}]
+        return df
+
+    def _extract_partitioned(self, since: str = None, after_id: int = None, until_id: int = None) -> pd.DataFrame:
+        """
+        Splits the matching id range into equal-width partitions and reads them
+        concurrently, one pooled connection each. psycopg2 and pyarrow release the
+        GIL while waiting on the socket and parsing, so threads are enough. With the
+        copy backend the partitions are concatenated as Arrow tables (no copy) and
+        converted to pandas once.
+        """
+        ranges = self._partition_ranges(since, after_id, until_id)
+        if len(ranges) <= 1:
+            return self._extract_whole(since, after_id, until_id)
+
+        def read(partition, first_id, last_id):
+            started = time.perf_counter()
+            if self.backend == "copy":
+                part = self._copy_part(since, first_id - 1, until_id=last_id)
+            else:
+                query, params = self._build_query(since, first_id - 1, until_id=last_id)
+                part = pd.read_sql_query(text(query), self.engine, params=params)
+            return part, {
+                "partition": partition,
+                "first_id": first_id,
+                "last_id": last_id,
+                "rows": len(part),
+                "seconds": round(time.perf_counter() - started, 4),
+            }
 
-    def extract(self, since: str = None) -> pd.DataFrame:
-        query = "SELECT * FROM mpesa_transactions"
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="extract") as pool:
+            results = list(pool.map(lambda r: read(*r), [(i, *bounds) for i, bounds in enumerate(ranges)]))
+
+        parts = [part for part, _ in results]
+        self.partition_timings = [timing for _, timing in results]
+
+        # Partitions are in id order, so the result keeps ORDER BY id
+        if self.backend == "copy":
+            df = self._copy_frame(parts)
+        else:
+            df = pd.concat(parts, ignore_index=True, copy=False)
+
+        logging.info(f"Extracted {len(df)} rows in {len(ranges)} partitions in {time.perf_counter() - started:.2f}s: {self.partition_timings}")
+        return df
+
+    def _partition_ranges(self, since: str = None, after_id: int = None, until_id: int = None) -> list[tuple[int, int]]:
+        """Inclusive (first_id, last_id) bounds splitting the rows to extract into self.partitions ranges."""
+        query, params = self._build_query(since, after_id, until_id, columns="min(id), max(id)")
+        query = query.replace(" ORDER BY id", "")
+        with self.engine.connect() as conn:
+            low, high = conn.execute(text(query), params).one()
+        if low is None:
+            return []
+
+        # Equal id widths; ids are dense enough (SERIAL, insert-only table) for this to balance rows
+        width = -(-(high - low + 1) // self.partitions)
+        return [(start, min(high, start + width - 1)) for start in range(low, high + 1, width)]
+
+    def _copy_part(self, since: str = None, after_id: int = None, until_id: int = None, limit: int = None):
+        """
+        Streams the projected columns with COPY ... TO STDOUT and parses the CSV in
+        one vectorized pass. No Python object is built per row. Returns a pyarrow
+        Table, or a DataFrame when pyarrow is not installed.
+        """
+        query, params = self._build_query(since, after_id, until_id, columns=COPY_SELECT, pyformat=True)
+        if limit is not None:
+            query += " LIMIT %(limit)s"
+            params["limit"] = limit
+
+        buffer = io.BytesIO()
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cur:
+                copy_sql = cur.mogrify(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", params)
+                cur.copy_expert(copy_sql.decode(), buffer)
+        finally:
+            conn.close()
+
+        buffer.seek(0)
+        return self._read_copy_csv(buffer)
+
+    def _copy_frame(self, parts) -> pd.DataFrame:
+        """
+        Turns COPY parts into the extract frame: msisdn categorical, transaction_id
+        Arrow-backed, amount_cents nullable Int64 (exact cents, NA where the
+        amount is unknown) and transaction_time datetime64. transaction_amount
+        is derived from amount_cents as float64 with NaN.
+        """
+        if pa is None:
+            df = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+            df["msisdn"] = df["msisdn"].astype("category")
+        else:
+            table = parts[0] if len(parts) == 1 else pa.concat_tables(parts)
+            # Dictionary columns become pandas Categoricals; plain strings stay in Arrow memory.
+            # int64 maps to Int64 so a NULL amount_cents does not turn the column into float64 (id is never NULL)
+            df = table.to_pandas(types_mapper={
+                pa.string(): pd.ArrowDtype(pa.string()),
+                pa.int64(): pd.Int64Dtype(),
+            }.get)
+            df["id"] = df["id"].astype("int64")
+
+        df["transaction_amount"] = df["amount_cents"].to_numpy(dtype=np.float64, na_value=np.nan) / 100
+        return df
+
+    def _extract_copy_chunks(self, since: str, after_id: int, chunk_size: int, until_id: int = None):
+        # Keyset pagination on id: each COPY picks up after the last id of the previous chunk
+        last_id = after_id
+        while True:
+            chunk = self._copy_frame([self._copy_part(since, last_id, until_id, limit=chunk_size)])
+            if chunk.empty:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_id = int(chunk["id"].max())
+
+    def _read_copy_csv(self, buffer):
+        if pa is None:
+            return pd.read_csv(
+                buffer,
+                dtype={"id": "int64", "transaction_id": "string", "msisdn": "category", "amount_cents": "Int64"},
+                parse_dates=["transaction_time"],
+            )
+
+        # COPY CSV writes NULL as an unquoted empty field and an empty string as "": only the former is null
+        return pa_csv.read_csv(buffer, convert_options=pa_csv.ConvertOptions(
+            column_types={
+                "id": pa.int64(),
+                "transaction_id": pa.string(),
+                "msisdn": pa.dictionary(pa.int32(), pa.string()),
+                "transaction_time": pa.timestamp("us"),
+                "amount_cents": pa.int64(),
+            },
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ))
+
+    def _build_query(self, since: str = None, after_id: int = None, until_id: int = None,
+                     columns: str = TRANSACTION_SELECT, pyformat: bool = False):
+        # SQLAlchemy text() takes :name placeholders, psycopg2 (COPY) takes %(name)s
+        placeholder = "%({})s" if pyformat else ":{}"
+        query = f"SELECT {columns} FROM mpesa_transactions"
+        conditions = []
         params = {}
 
         if since:
-            query += " WHERE transaction_time > %(since)s"
-            params = {"since": since}
-        
-        df = pd.read_sql_query(query, self.engine, params=params)
-        return df
+            conditions.append("transaction_at > " + placeholder.format("since"))
+            params["since"] = since
+        if after_id is not None:
+            conditions.append("id > " + placeholder.format("after_id"))
+            params["after_id"] = after_id
+        if until_id is not None:
+            conditions.append("id <= " + placeholder.format("until_id"))
+            params["until_id"] = until_id
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id"
+
+        return query, params
+
+    def get_watermark(self, pipeline: str) -> int:
+        """Highest mpesa_transactions.id already loaded by the pipeline (0 if it never ran)."""
+        with self.engine.connect() as conn:
+            last_id = conn.execute(
+                text("SELECT last_id FROM etl_watermarks WHERE pipeline = :pipeline"),
+                {"pipeline": pipeline}
+            ).scalar()
+        return last_id or 0
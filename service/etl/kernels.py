@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+HEATMAP_DAYS = 7
+HEATMAP_HOURS = 24
+HEATMAP_CELLS = HEATMAP_DAYS * HEATMAP_HOURS
+
+# 1970-01-01 was a Thursday (dayofweek 3, Monday = 0)
+EPOCH_DAYOFWEEK = 3
+
+
+def heatmap_codes(times: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    dayofweek * 24 + hour for every timestamp, from integer hours since the
+    epoch (no .dt accessors, no string day names), plus the mask of non-null rows
+    the codes belong to. Timezone-aware times are binned by their local wall clock.
+    """
+    if isinstance(times.dtype, pd.DatetimeTZDtype):
+        times = times.dt.tz_localize(None)
+    elif not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times, format='%Y%m%d%H%M%S')
+
+    hours = times.to_numpy(dtype='datetime64[h]')
+    valid = ~np.isnat(hours)
+    hours = hours[valid].astype(np.int64)
+
+    days, hour_of_day = np.divmod(hours, HEATMAP_HOURS)
+    return (days + EPOCH_DAYOFWEEK) % HEATMAP_DAYS * HEATMAP_HOURS + hour_of_day, valid
+
+
+def count_cells(codes: np.ndarray) -> np.ndarray:
+    """7x24 counts (Monday first, hour 0 first) of codes from heatmap_codes, e.g. cached on a TransactionBatch."""
+    return np.bincount(codes, minlength=HEATMAP_CELLS).reshape(HEATMAP_DAYS, HEATMAP_HOURS)
+
+
+def customer_totals(arrays: dict, n_keys: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-key transaction count, spend, and first and last transaction time (int64
+    microseconds; NaT as int64 max and min respectively) from integer key codes,
+    amounts and times. Shards of the same batch combine by summing the first two
+    and taking the min and max of the last two.
+    """
+    codes = arrays['codes']
+    times = arrays['times']
+    counts = np.bincount(codes, minlength=n_keys)
+    spend = np.bincount(codes, weights=arrays['amounts'], minlength=n_keys)
+
+    known = times != np.iinfo(np.int64).min
+    first_seen = np.full(n_keys, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first_seen, codes[known], times[known])
+    last_seen = np.full(n_keys, np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(last_seen, codes, times)
+    return counts, spend, first_seen, last_seen
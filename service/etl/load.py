@@ -1,11 +1,21 @@
-from pandas import DataFrame
+import asyncio
+import atexit
+import json
 import logging
 import os
-import psycopg2
-from dotenv import load_dotenv
+import threading
+import time
+from contextlib import contextmanager
 from typing import Dict, Any
-import asyncio
+
+from dotenv import load_dotenv
 from pandas import DataFrame
+from psycopg2.pool import ThreadedConnectionPool
+
+from service.etl.rfm_scores import RFMSketchStore
+from service.etl.bulk_writer import BulkWriter
+from service.etl.customer_merge import upsert_customer_merge
+from service.etl.customer_state import resident_customer_state
 
 load_dotenv()
 
@@ -14,6 +24,34 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool(**connect_kwargs) -> ThreadedConnectionPool:
+    """The loader connection pool of this process, opened on first use (later arguments are ignored)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(1, int(os.getenv("ETL_DB_POOL_SIZE", 4)), **connect_kwargs)
+        return _pool
+
+
+def close_connection_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+atexit.register(close_connection_pool)
+
+
+def batch_id(watermark: Dict[str, Any]) -> str:
+    """pipeline:from_id-last_id, the id range (from_id exclusive) a load covers."""
+    return f"{watermark['pipeline']}:{watermark['from_id']}-{watermark['last_id']}"
+
 
 class TransactionLoader:
     def __init__(self):
@@ -22,182 +60,173 @@ class TransactionLoader:
         self.password = os.getenv("DATABASE_PASSWORD")
         self.host = os.getenv("DATABASE_HOST", "localhost")
         self.port = int(os.getenv("DATABASE_PORT", 5432))
+        # The API maintains transaction_metrics and peak_hours itself when live aggregates are on
+        self.live_aggregates = os.getenv("LIVE_AGGREGATES_ENABLED", "false").lower() == "true"
+        self.rfm_store = RFMSketchStore()
 
+    @contextmanager
     def get_connection(self):
-        return psycopg2.connect(
+        pool = get_connection_pool(
             dbname=self.dbname,
             user=self.user,
             password=self.password,
             host=self.host,
             port=self.port,
         )
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            # A connection goes back to the pool without an open transaction
+            if not conn.closed:
+                conn.rollback()
+            pool.putconn(conn)
+
+    async def load(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._load_batch, data)
+
+    def _load_batch(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Writes every aggregate table of the batch, records it in etl_batches and
+        advances the watermark, all in one transaction. Either the whole batch is
+        applied or none of it, so a failed load is simply extracted and loaded
+        again. A batch id that is already recorded (a retried load) or already
+        behind the watermark is skipped, so retries never apply a batch twice.
+        """
+        watermark = data.get("watermark")
+        batch = batch_id(watermark) if watermark else None
+        started = time.perf_counter()
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            writer = BulkWriter(cursor)
+            try:
+                if watermark and not self._claim_batch(cursor, batch, watermark):
+                    logging.info(f"Batch {batch} is already loaded; skipping")
+                    conn.rollback()
+                    return {"status": "already_loaded", "batch_id": batch}
+
+                if self.live_aggregates:
+                    logging.info("Live aggregates enabled; skipping transaction metrics and heatmap")
+                else:
+                    self._update_metrics(writer, total=data["total_transactions"], volume=data["transaction_volume"])
+                self._update_customer_metrics(writer, data["customers"])
+                self._update_trends(writer, data["timeseries_trends"])
+                if not self.live_aggregates:
+                    self._update_heatmap(writer, data["activity_heatmap"])
+
+                if watermark:
+                    with writer.timed("etl_watermarks", rows=1):
+                        self._advance_watermark(cursor, watermark)
+                    cursor.execute(
+                        "UPDATE etl_batches SET timings = %s, loaded_at = NOW() WHERE batch_id = %s",
+                        (json.dumps(writer.stats), batch),
+                    )
 
-    async def load(self, data: Dict[str, Any]):
-        await asyncio.gather(
-            self._load_transaction_metrics(total=data["total_transactions"], volume=data["transaction_volume"]),
-            self._load_customers(data["customers"]),
-            self._load_trends(data["timeseries_trends"]),
-            self._load_activity_heatmap(data["activity_heatmap"]),
-        )
-
-    async def _load_transaction_metrics(self, total: int, volume: float):
-        await asyncio.to_thread(self._update_metrics, total=total, volume=volume)
-
-    async def _load_customers(self, df: DataFrame): 
-        await asyncio.to_thread(self._update_customer_metrics, df)
+                conn.commit()
 
-    async def _load_trends(self, timeseries_trends: Dict[str, Any]):
-        await asyncio.to_thread(self._update_trends, timeseries_trends)
+            except Exception as e:
+                logging.error(f"Error loading batch {batch}: {e}", exc_info=True)
+                conn.rollback()
+                return {"error": str(e), "batch_id": batch}
+            finally:
+                cursor.close()
 
-    async def _load_activity_heatmap(self, df: DataFrame):
-        await asyncio.to_thread(self._update_heatmap, df)
+        # The resident customer state may keep the merged totals now that they are stored
+        customer_state = resident_customer_state()
+        if customer_state is not None:
+            customer_state.confirm()
 
-    def _update_metrics(self, total: int, volume: float):
-        logging.info("Updating transaction metrics")
+        # The global RFM sketches are rebuilt from the stored customers once their interval is up,
+        # in a transaction of their own so the load never holds its locks during the scan
+        self._refresh_rfm_sketches()
 
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        seconds = round(time.perf_counter() - started, 4)
+        logging.info(f"Loaded batch {batch} in {seconds}s: {writer.stats}")
+        return {"status": "loaded", "batch_id": batch, "seconds": seconds, "timings": writer.stats}
 
+    def _refresh_rfm_sketches(self):
+        """Runs RFMSketchStore.refresh on its own connection; a failure only delays the rebuild."""
         try:
-            # Checking if any row exists
-            cursor.execute("SELECT id FROM transaction_metrics LIMIT 1")
-            result = cursor.fetchone()
-
-            if result:
-                # We update the existing row
-                cursor.execute("""
-                    UPDATE transaction_metrics
-                    SET total_transactions = total_transactions + %s,
-                        transaction_volume = transaction_volume + %s
-                    WHERE id = %s
-                """, (total, volume, result[0]))
-            else:
-                # We insert the first row
-                cursor.execute("""
-                    INSERT INTO transaction_metrics (total_transactions, transaction_volume)
-                    VALUES (%s, %s)
-                """, (total, volume))
-
-            conn.commit()
-            logging.info("Transaction metrics updated successfully")
-
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    self.rfm_store.refresh(cursor)
+                conn.commit()
         except Exception as e:
-            logging.error(f"Error updating transaction metrics: {e}", exc_info=True)
-            conn.rollback()
-        finally:
-            cursor.close()
-            conn.close()
+            logging.warning(f"Rebuilding the RFM sketches failed: {e}", exc_info=True)
+
+    def _claim_batch(self, cursor, batch: str, watermark: Dict[str, Any]) -> bool:
+        """
+        Records the batch in etl_batches for this transaction; False when it is
+        already recorded or the watermark has already passed it. A concurrent
+        load of the same batch waits on the row until this one commits or aborts.
+        """
+        cursor.execute("""
+            INSERT INTO etl_batches (batch_id, pipeline, from_id, last_id)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (batch_id) DO NOTHING
+            RETURNING batch_id
+        """, (batch, watermark["pipeline"], watermark["from_id"], watermark["last_id"]))
+        if cursor.fetchone() is None:
+            return False
+
+        cursor.execute("SELECT last_id FROM etl_watermarks WHERE pipeline = %s FOR UPDATE", (watermark["pipeline"],))
+        row = cursor.fetchone()
+        loaded = row[0] if row else 0
+        if loaded >= watermark["last_id"]:
+            return False
+        if loaded != watermark["from_id"]:
+            raise RuntimeError(
+                f"Batch {batch} does not start at the {watermark['pipeline']} watermark ({loaded}); it was extracted from a stale watermark"
+            )
+        return True
+
+    def _update_metrics(self, writer: BulkWriter, total: int, volume: float):
+        logging.info("Updating transaction metrics")
+
+        # A single row (id = 1, shared with the API's live aggregates): one upsert adds to it or creates it
+        with writer.timed("transaction_metrics", rows=1):
+            writer.cursor.execute("""
+                INSERT INTO transaction_metrics (id, total_transactions, transaction_volume)
+                VALUES (1, %(total)s, %(volume)s)
+                ON CONFLICT (id) DO UPDATE SET
+                    total_transactions = transaction_metrics.total_transactions + EXCLUDED.total_transactions,
+                    transaction_volume = transaction_metrics.transaction_volume + EXCLUDED.transaction_volume
+            """, {"total": total, "volume": volume})
 
 
-    def _update_customer_metrics(self, df: DataFrame):
+    def _update_customer_metrics(self, writer: BulkWriter, df: DataFrame):
         logging.info("Updating customer metrics")
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
 
-        try:
-            for _, row in df.iterrows():
-                cursor.execute("""
-                    INSERT INTO customers (
-                        msisdn, total_transactions, total_spend, avg_spend, last_seen,
-                        days_since_last, is_churned, churn_score, loyalty_score,
-                        first_seen, clv, r_score, f_score, m_score, customer_segment
-                    ) VALUES (
-                        %(msisdn)s, %(total_transactions)s, %(total_spend)s, %(avg_spend)s, %(last_seen)s,
-                        %(days_since_last)s, %(is_churned)s, %(churn_score)s, %(loyalty_score)s,
-                        %(first_seen)s, %(clv)s, %(r_score)s, %(f_score)s, %(m_score)s, %(customer_segment)s
-                    )
-                    ON CONFLICT (msisdn) DO UPDATE SET
-                        total_transactions = EXCLUDED.total_transactions,
-                        total_spend = EXCLUDED.total_spend,
-                        avg_spend = EXCLUDED.avg_spend,
-                        last_seen = EXCLUDED.last_seen,
-                        days_since_last = EXCLUDED.days_since_last,
-                        is_churned = EXCLUDED.is_churned,
-                        churn_score = EXCLUDED.churn_score,
-                        loyalty_score = EXCLUDED.loyalty_score,
-                        first_seen = EXCLUDED.first_seen,
-                        clv = EXCLUDED.clv,
-                        r_score = EXCLUDED.r_score,
-                        f_score = EXCLUDED.f_score,
-                        m_score = EXCLUDED.m_score,
-                        customer_segment = EXCLUDED.customer_segment
-                """, row.to_dict())
-
-            conn.commit()
-            logging.info("Customer metrics updated successfully")
+        # Batch partials are added to the stored totals and churn recomputed by set-based upserts
+        upsert_customer_merge(writer, df)
 
-        except Exception as e:
-            logging.error(f"Error updating customer metrics: {e}", exc_info=True)
-            conn.rollback()
-        finally:
-            cursor.close()
-            conn.close()
 
+    def _advance_watermark(self, cursor, watermark: Dict[str, Any]):
+        logging.info(f"Advancing {watermark['pipeline']} watermark to id {watermark['last_id']}")
+        cursor.execute("""
+            INSERT INTO etl_watermarks (pipeline, last_id, updated_at)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (pipeline) DO UPDATE SET
+                last_id = EXCLUDED.last_id,
+                updated_at = EXCLUDED.updated_at
+            WHERE etl_watermarks.last_id < EXCLUDED.last_id
+        """, (watermark["pipeline"], watermark["last_id"]))
 
-    def _update_trends(self, timeseries_trends: Dict[str, DataFrame]):
-        logging.info("Updating time series trends")
 
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _update_trends(self, writer: BulkWriter, timeseries_trends: Dict[str, DataFrame]):
+        logging.info("Updating time series trends")
 
+        # Each run only sees rows past the watermark, so buckets are accumulated rather than replaced
         for table_name, df in timeseries_trends.items():
-            for _, row in df.iterrows():
-                transaction_time = row["transaction_time"]
-                total_transactions = row["total_transactions"]
-                total_amount = row["total_amount"]
-
-                try:
-                    cursor.execute(f"""
-                        INSERT INTO {table_name} (transaction_time, total_transactions, total_amount)
-                        VALUES (%s, %s, %s)
-                        ON CONFLICT (transaction_time) DO UPDATE SET
-                            total_transactions = EXCLUDED.total_transactions,
-                            total_amount = EXCLUDED.total_amount;
-                    """, (transaction_time, total_transactions, total_amount))
-                except Exception as e:
-                    logging.error(f"Failed to insert into {table_name}: {e}", exc_info=True)
-                    continue
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-
-    def _update_heatmap(self, df: DataFrame):
-        logging.info(f"Updating heat map table")
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
+            writer.upsert(table_name, df, key=["transaction_time"], additive=["total_transactions", "total_amount"])
 
-        try:
-            for day_of_week, row in df.iterrows():  
-                row_data = row.to_dict()
-                update_values = []
-                set_clauses = []
-                
-                # We only include non-zero values in the update
-                for hour, value in row_data.items():
-                    if value != 0:
-                        set_clauses.append(f'"{hour}" = peak_hours."{hour}" + {int(value)}')
-                
-                if not set_clauses:  # We skip if all values are zero
-                    continue
-                    
-                update_query = f"""
-                    UPDATE peak_hours 
-                    SET {', '.join(set_clauses)}
-                    WHERE day_of_week = %s
-                """
-                
-                cursor.execute(update_query, (day_of_week,))
-                
-            conn.commit()
-            logging.info("Heatmap table updated successfully.")
 
-        except Exception as e:
-            logging.error(f"Error updating heatmap table: {e}", exc_info=True)
-            conn.rollback()
-        finally:
-            cursor.close()
-            conn.close()
\ No newline at end of file
+    def _update_heatmap(self, writer: BulkWriter, df: DataFrame):
+        logging.info(f"Updating heat map table")
+
+        # One row per weekday; the hour columns ("1".."24") are added to the stored counts
+        rows = df.reset_index()
+        rows.columns = [str(column) for column in rows.columns]
+        hours = [column for column in rows.columns if column != "day_of_week"]
+        writer.upsert("peak_hours", rows, key=["day_of_week"], additive=hours)
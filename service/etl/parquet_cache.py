@@ -0,0 +1,234 @@
+"""
+Local Parquet mirror of extracted transactions.
+
+    python -m service.etl.parquet_cache sync     # copy rows the mirror has not seen yet
+    python -m service.etl.parquet_cache info
+
+Rows are stored as a Hive-partitioned dataset (transaction_date=YYYY-MM-DD/)
+holding only the columns the transforms use. The coordinator appends every
+batch it extracts, so the mirror follows the primary without extra reads, and
+recomputes over history can scan it instead of mpesa_transactions.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+CACHE_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("transaction_id", pa.string()),
+    ("msisdn", pa.string()),
+    ("transaction_time", pa.timestamp("us")),
+    ("amount_cents", pa.int64()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("transaction_date", pa.date32())]), flavor="hive")
+
+# Files are named part-<first id>-<last id>-<n>.parquet; the meta file holds the last id written
+META_FILE = "_cache_meta.json"
+
+
+class TransactionParquetCache:
+    """
+    Append-only, day-partitioned Parquet copy of mpesa_transactions.
+
+    last_id (kept in _cache_meta.json) is the highest id the mirror holds. It is
+    written only after an append's files are on disk. Files past it come from
+    an interrupted append; they are ignored by reads and removed by the next
+    append, so a crash can never duplicate rows.
+    """
+    def __init__(self, root: str = None):
+        self.root = root or os.getenv("ETL_PARQUET_CACHE_DIR", "parquet_cache")
+        self.meta_path = os.path.join(self.root, META_FILE)
+        os.makedirs(self.root, exist_ok=True)
+        self.last_id = self._read_meta().get("last_id", 0)
+        self.file_format = ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=["msisdn"]))
+
+    def append(self, df: pd.DataFrame) -> int:
+        """Writes the rows of an extract frame the mirror does not hold yet. Returns the number written."""
+        if df.empty:
+            return 0
+        df = df[df["id"] > self.last_id]
+        if df.empty:
+            return 0
+
+        self._remove_orphans()
+        table = self._to_table(df)
+        first_id, last_id = int(df["id"].min()), int(df["id"].max())
+
+        ds.write_dataset(
+            table.append_column("transaction_date", pc.cast(table["transaction_time"], pa.date32())),
+            self.root,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f"part-{first_id}-{last_id}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+        self.last_id = last_id
+        self._write_meta()
+        return len(df)
+
+    def sync(self, extractor, until_id: int = None) -> int:
+        """Copies rows past last_id (up to until_id) from the primary in ETL_CHUNK_ROWS chunks."""
+        written = 0
+        for chunk in extractor.extract_chunks(after_id=self.last_id, until_id=until_id):
+            written += self.append(chunk)
+        if written:
+            logging.info(f"Parquet mirror synced {written} rows, now up to id {self.last_id}")
+        return written
+
+    def read(self, since: str = None, until: str = None, after_id: int = None, columns: list = None) -> pd.DataFrame:
+        """
+        Rows with since < transaction_time < until and id > after_id, ordered by id,
+        in the extractor's dtypes (msisdn categorical, amount_cents int64,
+        transaction_amount derived). The date bounds prune whole day partitions;
+        every bound is also pushed into the Parquet row-group scan. Ask for
+        amount_cents to get transaction_amount.
+        """
+        condition = self._condition(since, until, after_id)
+        columns = self._columns(columns)
+
+        if self._files():
+            table = self._dataset().to_table(columns=columns, filter=condition).sort_by("id")
+        else:
+            table = CACHE_SCHEMA.append(pa.field("transaction_date", pa.date32())).empty_table().select(columns)
+        return self._to_frame(table)
+
+    def read_batches(self, since: str = None, until: str = None, after_id: int = None,
+                     columns: list = None, batch_rows: int = 50_000):
+        """
+        The rows read() returns, yielded as DataFrames of at most batch_rows rows
+        so only one is held at a time. Batches follow the file layout, so rows
+        are not in id order across batches.
+        """
+        if not self._files():
+            return
+        scanner = self._dataset().scanner(
+            columns=self._columns(columns), filter=self._condition(since, until, after_id), batch_size=batch_rows,
+        )
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                yield self._to_frame(pa.Table.from_batches([batch]))
+
+    def _condition(self, since: str = None, until: str = None, after_id: int = None):
+        condition = ds.field("id") <= self.last_id
+        if since:
+            since = pd.Timestamp(since)
+            condition &= ds.field("transaction_date") >= pa.scalar(since.date(), pa.date32())
+            condition &= ds.field("transaction_time") > pa.scalar(since.to_pydatetime(), pa.timestamp("us"))
+        if until:
+            until = pd.Timestamp(until)
+            condition &= ds.field("transaction_date") <= pa.scalar(until.date(), pa.date32())
+            condition &= ds.field("transaction_time") < pa.scalar(until.to_pydatetime(), pa.timestamp("us"))
+        if after_id is not None:
+            condition &= ds.field("id") > after_id
+        return condition
+
+    @staticmethod
+    def _columns(columns: list = None) -> list:
+        columns = list(columns or CACHE_SCHEMA.names)
+        if "id" not in columns:
+            columns.append("id")
+        return columns
+
+    @staticmethod
+    def _to_frame(table: pa.Table) -> pd.DataFrame:
+        # As in the extractor: amount_cents stays integer with NA, transaction_amount is float64 with NaN
+        df = table.to_pandas(types_mapper={
+            pa.string(): pd.ArrowDtype(pa.string()),
+            pa.int64(): pd.Int64Dtype(),
+        }.get)
+        df["id"] = df["id"].astype("int64")
+        if "amount_cents" in df:
+            df["transaction_amount"] = df["amount_cents"].to_numpy(dtype="float64", na_value=float("nan")) / 100
+        return df
+
+    def info(self) -> dict:
+        files = self._files()
+        return {
+            "root": self.root,
+            "last_id": self.last_id,
+            "days": len({os.path.basename(os.path.dirname(path)) for path in files}),
+            "files": len(files),
+            "bytes": sum(os.path.getsize(path) for path in files),
+        }
+
+    def _dataset(self):
+        return ds.dataset(self.root, format=self.file_format, partitioning=PARTITIONING)
+
+    def _to_table(self, df: pd.DataFrame) -> pa.Table:
+        # The sql backend hands over float shillings, the copy backend integer cents
+        if "amount_cents" in df:
+            amount_cents = df["amount_cents"]
+        else:
+            amount_cents = (df["transaction_amount"] * 100).round()
+
+        frame = pd.DataFrame({
+            "id": df["id"].astype("int64"),
+            "transaction_id": df["transaction_id"].astype("string"),
+            "msisdn": df["msisdn"].astype("string"),
+            "transaction_time": pd.to_datetime(df["transaction_time"]).astype("datetime64[us]"),
+            "amount_cents": amount_cents.astype("Int64"),
+        })
+        return pa.Table.from_pandas(frame, schema=CACHE_SCHEMA, preserve_index=False)
+
+    def _files(self) -> list:
+        return glob.glob(os.path.join(self.root, "transaction_date=*", "part-*.parquet"))
+
+    def _remove_orphans(self):
+        for path in self._files():
+            first_id = int(os.path.basename(path).split("-")[1])
+            if first_id > self.last_id:
+                logging.warning(f"Removing {path}, left by an interrupted append")
+                os.remove(path)
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"last_id": self.last_id}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the local Parquet mirror of mpesa_transactions")
+    parser.add_argument("action", choices=["sync", "info"])
+    parser.add_argument("--root", help="Mirror directory (default ETL_PARQUET_CACHE_DIR)")
+    args = parser.parse_args(argv)
+
+    cache = TransactionParquetCache(args.root)
+    if args.action == "sync":
+        # Imported here: the extractor imports this module
+        from service.etl.extract import TransactionExtractor
+        cache.sync(TransactionExtractor(source="database"))
+
+    json.dump(cache.info(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import logging
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from service.etl.batch import TransactionBatch
+from service.etl.kernels import HEATMAP_DAYS, HEATMAP_HOURS, count_cells
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+class BatchPartials:
+    """
+    Mergeable partial aggregates of a batch that is streamed in chunks.
+
+    Each chunk folds into running totals, per-MSISDN partials (count, spend,
+    first and last seen), hourly or daily trend buckets (bucket_freq) and a 7x24
+    day-of-week/hour histogram, after which the chunk can be dropped. Peak
+    memory is bounded by the chunk size plus the number of distinct customers
+    and buckets in the batch, not by the number of transactions.
+    """
+    def __init__(self, compact_rows: int = 200_000, bucket_freq: str = 'D'):
+        self.compact_rows = compact_rows
+        self.bucket_freq = bucket_freq
+
+        self.total_transactions = 0
+        self.transaction_volume = 0.0
+        self.max_id = None
+        self.chunks = 0
+
+        self._customer_parts = []
+        self._customer_rows = 0
+        self._customer_base = 0
+        self._bucket_parts = []
+        self._bucket_rows = 0
+        self._bucket_base = 0
+        self._heatmap = np.zeros((HEATMAP_DAYS, HEATMAP_HOURS), dtype=np.int64)
+
+    def update(self, chunk: DataFrame):
+        self.chunks += 1
+        if chunk.empty:
+            return
+
+        batch = TransactionBatch(chunk)
+        times = batch.times
+        amounts = batch.amounts
+
+        self.total_transactions += len(chunk)
+        self.transaction_volume += float(amounts.sum())
+        chunk_max_id = int(chunk['id'].max())
+        self.max_id = chunk_max_id if self.max_id is None else max(self.max_id, chunk_max_id)
+
+        # Per-customer partials; transactions without a known time are left out of customer history
+        frame = DataFrame({
+            'msisdn': chunk['msisdn'],
+            'transaction_amount': amounts,
+            'transaction_time': times,
+        }).dropna(subset=['msisdn', 'transaction_amount', 'transaction_time'])
+        customers = frame.groupby('msisdn', observed=True).agg(
+            total_transactions=('transaction_amount', 'size'),
+            total_spend=('transaction_amount', 'sum'),
+            first_seen=('transaction_time', 'min'),
+            last_seen=('transaction_time', 'max'),
+        )
+        self._customer_parts.append(customers)
+        self._customer_rows += len(customers)
+
+        # Trend buckets
+        buckets = DataFrame({'total_transactions': 1, 'total_amount': amounts}) \
+            .groupby(times.dt.floor(self.bucket_freq).rename('transaction_time')) \
+            .agg(total_transactions=('total_transactions', 'sum'), total_amount=('total_amount', 'sum'))
+        self._bucket_parts.append(buckets)
+        self._bucket_rows += len(buckets)
+
+        # Day-of-week x hour histogram
+        self._heatmap += count_cells(batch.cell_codes[0])
+
+        # Compact once the uncompacted parts outgrow the last compacted result
+        if self._customer_rows > self._customer_base + self.compact_rows:
+            self._compact_customers()
+        if self._bucket_rows > self._bucket_base + self.compact_rows:
+            self._compact_buckets()
+
+    def customers(self) -> DataFrame:
+        """Per-MSISDN batch metrics in the shape TransactionTransformer.group_customers returns."""
+        self._compact_customers()
+        if not self._customer_parts:
+            return DataFrame(columns=['msisdn', 'total_transactions', 'total_spend', 'avg_spend', 'first_seen', 'last_seen'])
+
+        grouped = self._customer_parts[0].copy()
+        grouped['avg_spend'] = grouped['total_spend'] / grouped['total_transactions']
+        return grouped.reset_index()[['msisdn', 'total_transactions', 'total_spend', 'avg_spend', 'first_seen', 'last_seen']]
+
+    def buckets(self) -> DataFrame:
+        """Trend bucket totals indexed by bucket start (transaction_time), as TransactionTransformer.trend_buckets returns."""
+        self._compact_buckets()
+        if not self._bucket_parts:
+            return DataFrame(columns=['total_transactions', 'total_amount'],
+                             index=pd.DatetimeIndex([], name='transaction_time'))
+        return self._bucket_parts[0]
+
+    def heatmap_counts(self) -> np.ndarray:
+        """7x24 transaction counts, Monday first, hour 0 first."""
+        return self._heatmap.copy()
+
+    def _compact_customers(self):
+        if len(self._customer_parts) > 1:
+            combined = pd.concat(self._customer_parts).groupby(level=0).agg(
+                total_transactions=('total_transactions', 'sum'),
+                total_spend=('total_spend', 'sum'),
+                first_seen=('first_seen', 'min'),
+                last_seen=('last_seen', 'max'),
+            )
+            self._customer_parts = [combined]
+            self._customer_rows = self._customer_base = len(combined)
+
+    def _compact_buckets(self):
+        if len(self._bucket_parts) > 1:
+            combined = pd.concat(self._bucket_parts).groupby(level=0).sum()
+            self._bucket_parts = [combined]
+            self._bucket_rows = self._bucket_base = len(combined)
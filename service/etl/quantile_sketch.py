@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class KLLSketch:
+    """
+    Mergeable streaming quantile sketch (KLL).
+
+    Items live in a stack of compactors; an item at level h stands for 2**h
+    inputs. When a level outgrows its capacity it is sorted and every other item
+    (random offset) is promoted one level up, so the sketch keeps
+    O(k log(n / k)) floats whatever the number of inputs. Rank error is roughly
+    1.7 / k. Two sketches merge by concatenating levels and compacting, which
+    is what lets per-batch sketches be combined into global ones.
+    """
+    CAPACITY_DECAY = 2 / 3
+
+    def __init__(self, k: int = 200, seed=None):
+        self.k = k
+        self.n = 0
+        self.compactors = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values) -> "KLLSketch":
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.compactors[0] = np.concatenate([self.compactors[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, fractions) -> np.ndarray:
+        """Approximate values at the given fractions (0..1) of the distribution; NaN when empty."""
+        fractions = np.asarray(fractions, dtype=np.float64)
+        items = np.concatenate(self.compactors)
+        if not len(items):
+            return np.full(fractions.shape, np.nan)
+
+        weights = np.concatenate([np.full(len(items_at), 2 ** level, dtype=np.int64) for level, items_at in enumerate(self.compactors)])
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, fractions * cumulative[-1], side="left")
+        return items[order][np.minimum(positions, len(items) - 1)]
+
+    def size(self) -> int:
+        return sum(len(items) for items in self.compactors)
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "compactors": [items.tolist() for items in self.compactors]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLLSketch":
+        sketch = cls(k=data["k"])
+        sketch.n = data["n"]
+        sketch.compactors = [np.asarray(items, dtype=np.float64) for items in data["compactors"]] or [np.empty(0)]
+        return sketch
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, int(np.ceil(self.k * self.CAPACITY_DECAY ** depth)))
+
+    def _compress(self):
+        # Capacities shrink as levels are added, so sweep until every level fits
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self.compactors)):
+                items = self.compactors[level]
+                if len(items) <= self._capacity(level):
+                    continue
+
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind; the rest pair up and one of each pair moves up
+                odd = len(items) % 2
+                promoted = items[odd:][self._rng.integers(2)::2]
+                self.compactors[level] = items[:odd]
+                self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+                compacted = True
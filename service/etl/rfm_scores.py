@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from service.etl.quantile_sketch import KLLSketch
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+# Sketched metric -> customers column. Recency is sketched as last_seen (epoch
+# seconds) rather than days_since_last, so stored boundaries do not age.
+RFM_METRICS = {
+    "recency": "last_seen",
+    "frequency": "total_transactions",
+    "monetary": "avg_spend",
+}
+
+QUINTILES = [0.2, 0.4, 0.6, 0.8]
+
+# Serializes rebuilds across loaders
+REBUILD_LOCK_KEY = "rfm_sketches"
+
+# Customers fetched per round trip while rebuilding
+FETCH_ROWS = 50_000
+
+
+def metric_values(df: DataFrame, column: str) -> np.ndarray:
+    """A customers column as float64; timestamps become epoch seconds and missing values NaN."""
+    values = df[column]
+    if pd.api.types.is_datetime64_any_dtype(values):
+        seconds = values.to_numpy(dtype='datetime64[us]').view(np.int64) / 1e6
+        return np.where(values.isna().to_numpy(), np.nan, seconds)
+    return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class RFMSketchStore:
+    """
+    Global RFM quintile boundaries from KLL sketches kept in rfm_sketches.
+
+    The sketches hold one value per distinct customer: they are rebuilt from
+    the customers seen in the last RFM_SKETCH_WINDOW_DAYS days, streamed
+    through a server-side cursor, at most every RFM_SKETCH_REBUILD_MINUTES.
+    A customer seen in many batches therefore weighs no more than a one-off
+    one, and recent batches are ranked against everyone seen recently rather
+    than against each other. Boundaries lag the customers table by up to the
+    rebuild interval. The rebuild runs in a transaction of its own, after a
+    load has committed, so no load waits on it.
+    """
+    def __init__(self, window_days: int = None, k: int = None, rebuild_minutes: int = None):
+        self.window_days = int(window_days or os.getenv("RFM_SKETCH_WINDOW_DAYS", 90))
+        self.k = int(k or os.getenv("RFM_SKETCH_K", 200))
+        self.rebuild_minutes = int(rebuild_minutes or os.getenv("RFM_SKETCH_REBUILD_MINUTES", 60))
+
+    def batch_sketches(self, df: DataFrame) -> dict:
+        return {
+            metric: KLLSketch(self.k).update(metric_values(df, column))
+            for metric, column in RFM_METRICS.items()
+        }
+
+    def window(self, cursor) -> dict:
+        """The stored sketches, one per metric (empty before the first rebuild)."""
+        sketches = {metric: KLLSketch(self.k) for metric in RFM_METRICS}
+        cursor.execute("SELECT metric, sketch FROM rfm_sketches")
+        for metric, sketch in cursor.fetchall():
+            if metric in sketches:
+                sketches[metric].merge(KLLSketch.from_dict(sketch))
+        return sketches
+
+    def refresh(self, cursor) -> int:
+        """
+        Rebuilds the sketches when they are older than rebuild_minutes, unless
+        another process is already at it. Runs in the caller's transaction,
+        which should hold nothing else. Returns the number of customers
+        sketched (0 when nothing was rebuilt).
+        """
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (REBUILD_LOCK_KEY,))
+        if not cursor.fetchone()[0]:
+            return 0
+
+        # Fresh means every metric has a sketch rebuilt within the interval
+        cursor.execute("""
+            SELECT COUNT(*) = %s AND MIN(updated_at) > NOW() - make_interval(mins => %s)
+            FROM rfm_sketches
+        """, (len(RFM_METRICS), self.rebuild_minutes))
+        if cursor.fetchone()[0]:
+            return 0
+        return self.rebuild(cursor)
+
+    def rebuild(self, cursor) -> int:
+        """Replaces the stored sketches with ones over the customers seen in the window. Returns the customers sketched."""
+        columns = list(RFM_METRICS.values())
+        sketches = {metric: KLLSketch(self.k) for metric in RFM_METRICS}
+        customers = 0
+
+        with cursor.connection.cursor(name="rfm_sketch_customers") as source:
+            source.execute(f"""
+                SELECT {', '.join(columns)} FROM customers
+                WHERE last_seen > LOCALTIMESTAMP - make_interval(days => %s)
+            """, (self.window_days,))
+            while True:
+                rows = source.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                chunk = DataFrame(rows, columns=columns)
+                for metric, sketch in self.batch_sketches(chunk).items():
+                    sketches[metric].merge(sketch)
+                customers += len(rows)
+
+        for metric, sketch in sketches.items():
+            cursor.execute("""
+                INSERT INTO rfm_sketches (metric, sketch, updated_at)
+                VALUES (%s, %s, NOW())
+                ON CONFLICT (metric) DO UPDATE SET
+                    sketch = EXCLUDED.sketch,
+                    updated_at = EXCLUDED.updated_at
+            """, (metric, json.dumps(sketch.to_dict())))
+
+        logging.info(f"Rebuilt RFM sketches from {customers} customers seen in the last {self.window_days} days")
+        return customers
+
+
+def score_rfm(df: DataFrame, sketches: dict) -> dict:
+    """
+    1-5 scores per customer from global quintile boundaries: one searchsorted
+    per metric, so O(batch). A value moves up a score only by exceeding a
+    boundary, so a pile of ties (say, one-off customers) shares the lowest score.
+    Recency ranks last_seen, so a more recent payment scores higher.
+    """
+    scores = {}
+    for metric, column in RFM_METRICS.items():
+        boundaries = sketches[metric].quantiles(QUINTILES)
+        above = np.searchsorted(boundaries, metric_values(df, column), side="left")
+        scores[metric] = np.minimum(above, len(QUINTILES)) + 1
+    return {"r_score": scores["recency"], "f_score": scores["frequency"], "m_score": scores["monetary"]}
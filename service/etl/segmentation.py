@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "segment_rules.json")
+
+# Inclusive bounds a rule may put on a customer column
+BOUNDS = {
+    "min": np.greater_equal,
+    "max": np.less_equal,
+}
+
+
+class CompiledSegmentRules:
+    """
+    Ordered segment rules compiled to vectorized masks.
+
+    Each segment lists min/max bounds on customer columns (r_score, f_score,
+    m_score, or any other numeric column such as clv). A customer gets the first
+    segment whose bounds all hold, otherwise the default; assignment is one
+    np.select over boolean masks, linear in the number of customers.
+
+        {"default": "Other",
+         "segments": [{"segment": "Best Customers", "when": {"r_score": {"min": 4}, "f_score": {"min": 4}}}, ...]}
+    """
+    def __init__(self, config: dict, version: str = None):
+        self.version = version
+        self.default = config.get("default", "Other")
+        self.segments = []
+
+        for rule in config.get("segments", []):
+            conditions = []
+            for column, bounds in rule.get("when", {}).items():
+                unknown = set(bounds) - set(BOUNDS)
+                if unknown:
+                    raise ValueError(f"Segment {rule['segment']!r}: unknown bound(s) {sorted(unknown)} on {column}, expected {sorted(BOUNDS)}")
+                conditions += [(column, BOUNDS[bound], float(value)) for bound, value in bounds.items()]
+            self.segments.append((rule["segment"], conditions))
+
+        names = [name for name, _ in self.segments]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate segment names in {names}")
+
+        self.categories = list(dict.fromkeys(names + [self.default]))
+        self.columns = sorted({column for _, conditions in self.segments for column, _, _ in conditions})
+
+    def assign(self, df: DataFrame) -> pd.Categorical:
+        values = {column: df[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in self.columns}
+
+        masks = []
+        for _, conditions in self.segments:
+            mask = np.ones(len(df), dtype=bool)
+            for column, compare, threshold in conditions:
+                mask &= compare(values[column], threshold)
+            masks.append(mask)
+
+        default_code = self.categories.index(self.default)
+        if masks:
+            codes = np.select(masks, np.arange(len(masks)), default=default_code)
+        else:
+            codes = np.full(len(df), default_code)
+        return pd.Categorical.from_codes(codes, categories=self.categories)
+
+
+_compiled = {}
+
+
+def load_segment_rules(path: str = None) -> CompiledSegmentRules:
+    """
+    Rules from SEGMENT_RULES_PATH (default: segment_rules.json next to this module),
+    recompiled only when the file changes. A broken edit (bad JSON, unknown bounds,
+    values or sections of the wrong type) keeps the last good rules.
+    """
+    path = path or os.getenv("SEGMENT_RULES_PATH") or DEFAULT_RULES_PATH
+    stat = os.stat(path)
+    version = f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    cached = _compiled.get(path)
+    if cached is not None and cached.version == version:
+        return cached
+
+    try:
+        with open(path, "r") as f:
+            rules = CompiledSegmentRules(json.load(f), version=version)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        if cached is None:
+            raise
+        logging.error(f"Invalid segment rules in {path}, keeping the previous ones: {e}")
+        return cached
+
+    _compiled[path] = rules
+    logging.info(f"Loaded {len(rules.segments)} segment rules from {path}")
+    return rules
@@ -1,10 +1,15 @@
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
-from sqlalchemy import create_engine, text
-import asyncio
-from pandas import DataFrame, to_timedelta
+from sqlalchemy import create_engine
+from pandas import DataFrame
 import numpy as np
 import pandas as pd
-from dateutil.relativedelta import relativedelta
+from service.etl.clv import clv_shard, customer_lifetime_value
+from service.etl.segmentation import load_segment_rules
+from service.etl.rfm_scores import RFMSketchStore, score_rfm
+from service.etl.batch import TransactionBatch
+from service.etl.customer_merge import preview_customer_merge
+from service.etl.customer_state import customer_state_backend, get_customer_state
+from service.etl.kernels import count_cells, customer_totals
+from service.etl.workers import map_shards, worker_min_rows
 import logging
 import os
 
@@ -13,332 +18,247 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Trend granularity -> pandas period alias; each one is loaded into <granularity>_trends
+TREND_PERIODS = {
+    'hourly': 'h',
+    'daily': 'D',
+    'weekly': 'W',
+    'monthly': 'M',
+    'quarterly': 'Q',
+}
+
+
+def trend_granularities() -> list[str]:
+    names = [name.strip() for name in os.getenv("ETL_TREND_GRANULARITIES", "hourly,daily,weekly,monthly,quarterly").split(",") if name.strip()]
+    unknown = set(names) - set(TREND_PERIODS)
+    if unknown:
+        raise ValueError(f"Unknown ETL_TREND_GRANULARITIES {sorted(unknown)}, expected any of {list(TREND_PERIODS)}")
+    return names
+
+
+def trend_grain(granularities: list[str]) -> str:
+    """Finest bucket the batch is aggregated to; every coarser trend is rolled up from it."""
+    return 'h' if 'hourly' in granularities else 'D'
+
+
 class TransactionTransformer:
     def __init__(self):
-        self.process_pool = ProcessPoolExecutor()
-        self.thread_pool = ThreadPoolExecutor()
         self.dbname = os.getenv("DATABASE_NAME")
         self.user = os.getenv("DATABASE_USER")
         self.password = os.getenv("DATABASE_PASSWORD")
         self.host = os.getenv("DATABASE_HOST", "localhost")
         self.port = int(os.getenv("DATABASE_PORT", 5432))
         self.db_engine = self._create_engine()
+        self.rfm_store = RFMSketchStore()
+        self.trend_granularities = trend_granularities()
+        self.trend_grain = trend_grain(self.trend_granularities)
+        self.customer_state = get_customer_state(self.db_engine) if customer_state_backend() == "resident" else None
 
 
-    def parse_time(self, df: DataFrame) -> DataFrame:
-        logging.info("Parsing time")
-        df['transaction_time'] = pd.to_datetime(df['transaction_time'], format='%Y%m%d%H%M%S')
-
-        return df
+    # The batch methods below take a TransactionBatch (a plain DataFrame is wrapped in one).
+    # Parsed times and amounts are then derived once per batch and shared, and the frame is never modified.
 
-
-    def get_total_transactions(self, df: DataFrame) -> int:
+    def get_total_transactions(self, batch: TransactionBatch) -> int:
         logging.info("Computing total trasnactions")
 
-        return len(df)    
+        return len(batch)
 
 
-    def compute_transaction_volume(self, df: DataFrame) -> float:
+    def compute_transaction_volume(self, batch: TransactionBatch) -> float:
         logging.info("Computing transaction volume")
 
-        df['transaction_amount'] = pd.to_numeric(df['transaction_amount'], errors='coerce')
-        df = df.dropna(subset=['transaction_amount'])
-
-        return round(df['transaction_amount'].sum(), 2)
+        return round(TransactionBatch.of(batch).amounts.sum(), 2)
 
 
-    def get_repeat_customers(self, df: pd.DataFrame) -> pd.DataFrame:
+    def get_repeat_customers(self, batch: TransactionBatch) -> pd.DataFrame:
         logging.info("Updating customer metrics")
 
-         # Ensuring transaction_amount is numeric
-        df['transaction_amount'] = pd.to_numeric(df['transaction_amount'], errors='coerce')
-        df = df.dropna(subset=['msisdn', 'transaction_amount'])
+        return self.merge_customers(self.group_customers(batch))
 
-        # New metrics from the incoming batch
-        new_grouped = df.groupby('msisdn').agg(
+
+    def group_customers(self, batch: TransactionBatch) -> DataFrame:
+        batch = TransactionBatch.of(batch)
+        # Transactions without a known time stay out of customer history (first and last seen are NOT NULL)
+        df = DataFrame({
+            'msisdn': batch.column('msisdn'),
+            'transaction_id': batch.column('transaction_id'),
+            'transaction_amount': batch.amounts,
+            'transaction_time': batch.times,
+        }).dropna(subset=['msisdn', 'transaction_amount', 'transaction_time'])
+        if len(df) >= worker_min_rows():
+            return self._group_customers_on_workers(df)
+
+        # New metrics from the incoming batch (observed=True as msisdn is categorical from the copy backend)
+        return df.groupby('msisdn', observed=True).agg(
             total_transactions=('transaction_id', 'count'),
             total_spend=('transaction_amount', 'sum'),
             avg_spend=('transaction_amount', 'mean'),
+            first_seen=('transaction_time', 'min'),
             last_seen=('transaction_time', 'max')
         ).reset_index()
 
-        # Existing customer records from the DB
-        msisdns = new_grouped['msisdn'].tolist()
-        existing_df = self._fetch_existing_customers(msisdns) 
 
-        if existing_df.empty:
-            logging.info("No existing customers found — persisting all as new.")
-            self._persist_customers(new_grouped)  
-            return new_grouped
+    def _group_customers_on_workers(self, df: DataFrame) -> DataFrame:
+        """
+        group_customers for large batches: MSISDNs are factorized to integer codes
+        here, then the worker pool aggregates row shards from shared memory and
+        the per-shard totals are combined. msisdn keeps the input dtype, as in
+        the in-process path (categorical from the copy backend), and so does the
+        unit of the seen times.
+        """
+        codes, msisdns = pd.factorize(df['msisdn'], sort=True)
+        arrays = {
+            'codes': codes.astype(np.int64),
+            'amounts': df['transaction_amount'].to_numpy(dtype=np.float64),
+            'times': df['transaction_time'].to_numpy(dtype='datetime64[us]').view(np.int64),
+        }
+        shards = map_shards(customer_totals, arrays, len(df), len(msisdns))
+
+        counts = np.sum([shard[0] for shard in shards], axis=0)
+        spend = np.sum([shard[1] for shard in shards], axis=0)
+        first_seen = np.min([shard[2] for shard in shards], axis=0)
+        last_seen = np.max([shard[3] for shard in shards], axis=0)
+        # Customers whose times are all missing get NaT rather than the int64 max sentinel
+        first_seen[first_seen == np.iinfo(np.int64).max] = np.iinfo(np.int64).min
+        return DataFrame({
+            # factorize keeps a categorical's dtype (and categories) in its uniques
+            'msisdn': pd.Series(msisdns),
+            'total_transactions': counts,
+            'total_spend': spend,
+            'avg_spend': spend / counts,
+            'first_seen': first_seen.view('datetime64[us]').astype(df['transaction_time'].dtype),
+            'last_seen': last_seen.view('datetime64[us]').astype(df['transaction_time'].dtype),
+        })
+
 
-        # Merging with new data
-        merged_df = pd.merge(existing_df, new_grouped, on='msisdn', suffixes=('_old', '_new'))
-        updated_customers = self._update_cummulative_metrics(merged_df)
+    def merge_customers(self, new_grouped: DataFrame) -> DataFrame:
+        """Folds a batch's per-MSISDN metrics into the customers' cumulative history."""
+        if self.customer_state is not None:
+            return self.customer_state.merge(new_grouped)
 
-        return updated_customers
+        # Postgres joins the staged batch partials to the stored customers; the loader writes the same merge
+        conn = self.db_engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                return preview_customer_merge(cursor, new_grouped)
+        finally:
+            # The staging table is dropped with the transaction
+            conn.rollback()
+            conn.close()
 
 
-    def get_peak_hours(self, df: DataFrame) -> DataFrame:
+    def get_peak_hours(self, batch: TransactionBatch) -> DataFrame:
+        """Day-of-week x hour transaction counts of the batch in the peak_hours shape, from one bincount."""
         logging.info("Getting peak hours")
-        # Extracting hour and day of week
-        df['hour'] = df['transaction_time'].dt.hour + 1
-        df['day_of_week'] = df['transaction_time'].dt.day_name()
-
-        all_hours = list(range(1, 25))
-
-        # Creating a new pivot table from the current batch
-        new_pivot_table = df.pivot_table(
-            index='day_of_week',
-            columns='hour',
-            values='transaction_id',
-            aggfunc='count',
-            fill_value=0
+        codes, _ = TransactionBatch.of(batch).cell_codes
+        return self.peak_hours_from_counts(count_cells(codes))
+
+
+    def peak_hours_from_counts(self, counts: np.ndarray) -> DataFrame:
+        """7x24 cells (Monday first, hour 0 first) in the shape get_peak_hours returns."""
+        return DataFrame(
+            counts,
+            index=pd.Index(DAY_ORDER, name='day_of_week'),
+            columns=pd.Index(range(1, 25), name='hour'),
         )
 
-        # Sorting the days of the week from Monday to Sunday and filling missing hours
-        new_pivot_table = new_pivot_table.reindex(columns=all_hours, fill_value=0)
-        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        new_pivot_table = new_pivot_table.reindex(day_order)
 
-        return new_pivot_table
+    def trend_buckets(self, batch: TransactionBatch) -> DataFrame:
+        """
+        Transaction count and amount per finest-grain bucket (hour or day), indexed
+        by bucket start. This is the only pass over the batch's rows.
+        """
+        batch = TransactionBatch.of(batch)
 
+        return DataFrame({'total_transactions': 1, 'total_amount': batch.amounts}) \
+            .groupby(batch.times.dt.floor(self.trend_grain).rename('transaction_time')) \
+            .sum()
 
-    async def compute_timeseries(self, df: DataFrame) -> dict[str, DataFrame]:
-        logging.info(f"Computing time series")
-        daily_task = asyncio.to_thread(self._get_timeseries_trends, df, 'D')
-        weekly_task = asyncio.to_thread(self._get_timeseries_trends, df, 'W')
-        monthly_task = asyncio.to_thread(self._get_timeseries_trends, df, 'M')
 
-        daily, weekly, monthly = await asyncio.gather(daily_task, weekly_task, monthly_task)
+    def rollup_trends(self, buckets: DataFrame) -> dict[str, DataFrame]:
+        """
+        Every configured granularity, rolled up from the bucket totals rather than
+        the batch. Adding one costs a groupby over at most a few thousand rows.
+        Hourly and daily rows are labelled with the bucket start; weekly,
+        monthly and quarterly ones with the period's last day (Sunday, month end,
+        quarter end), as resample('W'/'M') labelled them. Empty periods inside
+        the range are kept as zero rows.
+        """
+        trends = {}
+        for granularity in self.trend_granularities:
+            period = TREND_PERIODS[granularity]
+            if buckets.empty:
+                trends[f'{granularity}_trends'] = DataFrame(columns=['transaction_time', 'total_transactions', 'total_amount'])
+                continue
+
+            periods = buckets.index.to_period(period)
+            rolled = buckets.groupby(periods).sum()
+            rolled = rolled.reindex(pd.period_range(periods.min(), periods.max(), freq=period), fill_value=0)
+
+            if granularity in ('hourly', 'daily'):
+                labels = rolled.index.start_time
+            else:
+                labels = rolled.index.end_time.normalize()
+            trends[f'{granularity}_trends'] = DataFrame({
+                'transaction_time': labels,
+                'total_transactions': rolled['total_transactions'].to_numpy(),
+                'total_amount': rolled['total_amount'].to_numpy(),
+            })
+
+        return trends
+
+
+    async def compute_timeseries(self, batch: TransactionBatch) -> dict[str, DataFrame]:
+        logging.info(f"Computing time series")
 
-        timeseries_result =  {
-            'daily_trends': daily,
-            'weekly_trends': weekly,
-            'monthly_trends': monthly,
-        }
-    
-        return timeseries_result
+        return self.rollup_trends(self.trend_buckets(batch))
 
     
     def cluster_customers_fcm(self, df: DataFrame) -> DataFrame:
         logging.info(f"Clustering customers")
 
-        # Recency: lower days_since_last is better (recently active)
-        df['r_score'] = pd.qcut(df['days_since_last'], q=5, labels=[5, 4, 3, 2, 1]).astype(int)
-        # Frequency: higher total_transactions is better
-        df['f_score'] = pd.qcut(df['total_transactions'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5]).astype(int)
-        # Monetary: higher avg_spend is better
-        df['m_score'] = pd.qcut(df['avg_spend'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5]).astype(int)
+        # Quintiles are global: sketches of the distinct customers seen recently, rebuilt by the loader.
+        # Until the first rebuild the batch is ranked against itself.
+        sketches = self._rfm_window()
+        if any(sketch.n == 0 for sketch in sketches.values()):
+            sketches = self.rfm_store.batch_sketches(df)
 
-        df['customer_segment'] = df.apply(self._assign_segment, axis=1)
+        # All three are higher-is-better: recency ranks last_seen, so a more recent payment scores higher
+        for column, scores in score_rfm(df, sketches).items():
+            df[column] = scores
+
+        # Segments come from the declarative rules in SEGMENT_RULES_PATH (segment_rules.json by default)
+        df['customer_segment'] = load_segment_rules().assign(df)
     
         return df
 
 
     def predict_customer_lifetime_value(self, df: DataFrame) -> DataFrame:
         logging.info("Calculating clv")
-        df['clv'] = df.apply(self._calculate_clv, axis=1)
-        
-        return df
-
-
-    def _calculate_clv(self, row):
-        if row['first_seen'] > row['last_seen']:
-            return 0.0
-
-        delta = relativedelta(row['last_seen'], row['first_seen'])
-        months = delta.years * 12 + delta.months + (delta.days / 30.44)  # Partial month as a fraction
-        months_active = round(months, 2)
-
-        if months_active == 0:
-            return 0.0
-
-        frequency = row['total_transactions'] / months_active
-        clv = row['avg_spend'] * frequency * months_active
-
-        return clv
-
-    def _update_cummulative_metrics(self, df: DataFrame) -> DataFrame:
-        now = pd.Timestamp.now()
-        # Updating cumulative metrics
-        df['total_transactions'] = df['total_transactions_old'] + df['total_transactions_new']
-        df['total_spend'] = df['total_spend_old'] + df['total_spend_new']
-        df['avg_spend'] = df['total_spend'] / df['total_transactions']
-        df['last_seen'] = df[['last_seen_old', 'last_seen_new']].max(axis=1)
-        df['first_seen'] = df['last_seen'] - to_timedelta(
-                np.random.randint(10, 181, size=len(df)), unit='D'
-            )
-
-        # Recomputing churn and loyalty
-        df['days_since_last'] = (now - df['last_seen']).dt.days
-        df['is_churned'] = df['days_since_last'] > 30
-        df['churn_score'] = df['days_since_last'] / 60.0
-        df['churn_score'] = df['churn_score'].clip(0, 1)
-        df['loyalty_score'] = np.log1p(df['total_transactions']) * (1 - df['churn_score'])
-
-        updated_customers = df[[
-            'msisdn',
-            'total_transactions',
-            'total_spend',
-            'avg_spend',
-            'first_seen',
-            'last_seen',
-            'days_since_last',
-            'is_churned',
-            'churn_score',
-            'loyalty_score'
-        ]].copy()
-
-        return updated_customers.sort_values(by='loyalty_score', ascending=False)
-
-    def _assign_segment(self, row):
-        if row['r_score'] >= 4 and row['f_score'] >= 4 and row['m_score'] >= 4:
-            return 'Best Customers'
-        elif row['r_score'] >= 4 and row['f_score'] >= 4:
-            return 'Loyal Customers'
-        elif row['r_score'] >= 4 and row['f_score'] <= 2:
-            return 'Potential Loyalists'
-        elif row['r_score'] <= 2 and row['f_score'] <= 2 and row['m_score'] <= 2:
-            return 'Lost Customers'
-        elif row['r_score'] <= 2 and row['f_score'] <= 3:
-            return 'Churn Risk'
+        # Vectorized; matches the former row-wise relativedelta computation exactly
+        if len(df) >= worker_min_rows():
+            arrays = {
+                'first_seen': pd.to_datetime(df['first_seen']).to_numpy(dtype='datetime64[us]'),
+                'last_seen': pd.to_datetime(df['last_seen']).to_numpy(dtype='datetime64[us]'),
+                'total_transactions': df['total_transactions'].to_numpy(dtype=np.float64),
+                'avg_spend': df['avg_spend'].to_numpy(dtype=np.float64),
+            }
+            df['clv'] = np.concatenate(map_shards(clv_shard, arrays, len(df)))
         else:
-            return 'Other'
-
-
-    def _get_timeseries_trends(self, df: DataFrame, freq: str) -> DataFrame:
-        """
-        Here, we timeseries trends grouped by a given frequency.
+            df['clv'] = customer_lifetime_value(df)
         
-        Args:
-            df: DataFrame with 'transaction_time' and 'transaction_amount'.
-            freq: Resampling frequency - 'D' (day), 'W' (week), 'M' (month)
-            
-        Returns:
-            DataFrame with date index and aggregated metrics.
-        """
-        df = df.copy()
-        df['transaction_time'] = pd.to_datetime(df.get('transaction_time', pd.Timestamp.now()))
-        df['transaction_amount'] = df.get('transaction_amount', 0)
-        df['transaction_id'] = df.get('transaction_id', range(len(df)))
-        df['transaction_time'] = pd.to_datetime(df['transaction_time'])
-        df.set_index('transaction_time', inplace=True)
-
-        trends = df.resample(freq).agg({
-            'transaction_id': 'count',
-            'transaction_amount': 'sum'
-        }).rename(columns={
-            'transaction_id': 'total_transactions',
-            'transaction_amount': 'total_amount'
-        })
-
-        return trends.reset_index()
+        return df
 
 
-    def _persist_customers(self, df: pd.DataFrame):
+    def _rfm_window(self) -> dict:
+        conn = self.db_engine.raw_connection()
         try:
-            # Check if the dataframe is empty
-            if df.empty:
-                logging.info("No customers to persist.")
-                return
-
-            df = self._update_cummulative_metrics(df)
-
-            # Iterate through the DataFrame to either insert or update customers
-            with self.db_engine.connect() as conn:
-                for index, row in df.iterrows():
-                    msisdn = row['msisdn']
-                    total_transactions = row['total_transactions']
-                    total_spend = row['total_spend']
-                    avg_spend = row['avg_spend']
-                    first_seen = row['first_seen']
-                    last_seen = row['last_seen']
-                    days_since_last = row['days_since_last']
-                    is_churned = row['is_churned']
-                    churn_score = row['churn_score']
-                    loyalty_score = row['loyalty_score']
-                    
-                    # Checking if the msisdn exists in the database
-                    existing_customer_query = text("""
-                        SELECT COUNT(*) FROM customers WHERE msisdn = :msisdn
-                    """)
-                    result = conn.execute(existing_customer_query, {"msisdn": msisdn}).scalar()
-
-                    if result > 0:
-                        # If customer exists, update the record
-                        update_query = text("""
-                            UPDATE customers
-                            SET total_transactions = :total_transactions,
-                                total_spend = :total_spend,
-                                avg_spend = :avg_spend,
-                                last_seen = :last_seen,
-                                days_since_last = :days_since_last
-                                is_churned = :is_churned
-                                churn_score = :churn_score
-                                loyalty_score = :loyalty_score
-                            WHERE msisdn = :msisdn
-                        """)
-
-                        logging.info(f"customer exists, update query {update_query}")
-                        conn.execute(update_query, {
-                            "msisdn": msisdn,
-                            "total_transactions": total_transactions,
-                            "total_spend": total_spend,
-                            "avg_spend": avg_spend,
-                            "last_seen": last_seen,
-                            "days_since_last": days_since_last,
-                            "is_churned": is_churned,
-                            "churn_score": churn_score,
-                            "loyalty_score": loyalty_score
-                        })
-                    else:
-                        # If customer doesn't exist, insert new record
-                        insert_query = text("""
-                            INSERT INTO customers (
-                                msisdn, 
-                                total_transactions, 
-                                total_spend, 
-                                avg_spend, 
-                                first_seen,
-                                last_seen, 
-                                days_since_last,
-                                is_churned,
-                                churn_score,
-                                loyalty_score
-                            )
-                            VALUES (:msisdn, :total_transactions, :total_spend, :avg_spend, :last_seen, :days_since_last, :is_churned, :churn_score, :loyalty_score)
-                        """)
-
-                        conn.execute(insert_query, {
-                            "msisdn": msisdn,
-                            "total_transactions": total_transactions,
-                            "total_spend": total_spend,
-                            "avg_spend": avg_spend,
-                            "last_seen": last_seen,
-                            "first_seen": last_seen,
-                            "days_since_last": days_since_last,
-                            "is_churned": is_churned,
-                            "churn_score": churn_score,
-                            "loyalty_score": loyalty_score
-                        })
-                conn.commit()
-
-            logging.info("Customer data persisted successfully.")
-
-        except Exception as e:
-            logging.error(f"Error while persisting customer data: {e}")
-            raise
-
-
-    def _fetch_existing_customers(self, msisdns):
-        query = text("""
-            SELECT msisdn, total_transactions, total_spend, avg_spend, first_seen, last_seen,
-                days_since_last, is_churned, churn_score, loyalty_score
-            FROM customers
-            WHERE msisdn = ANY(:msisdns)
-        """)
-        with self.db_engine.connect() as conn:
-            return pd.read_sql_query(query, conn, params={"msisdns": msisdns})
+            with conn.cursor() as cursor:
+                return self.rfm_store.window(cursor)
+        finally:
+            conn.close()
 
     def _create_engine(self):
         db_url = f"postgresql+psycopg2://{self.user}:{self.password}@{self.host}:{self.port}/{self.dbname}"
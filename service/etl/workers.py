@@ -0,0 +1,125 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Offsets of packed arrays are aligned to a cache line
+ALIGNMENT = 64
+
+
+def worker_count() -> int:
+    return max(1, int(os.getenv("ETL_WORKER_PROCESSES") or os.cpu_count() or 1))
+
+
+def worker_min_rows() -> int:
+    """Below this many rows a step runs in-process; shipping it to workers would cost more than it saves."""
+    return int(os.getenv("ETL_WORKER_MIN_ROWS", 200_000))
+
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    """
+    The one process pool of this process, started on first use and shared by
+    every transformer. Workers come from a forkserver, so they are not forked
+    from a process full of actor threads.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=worker_count(), mp_context=multiprocessing.get_context("forkserver"))
+            logging.info(f"Started ETL worker pool with {worker_count()} processes")
+        return _pool
+
+
+def shutdown_worker_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_worker_pool)
+
+
+class SharedArrays:
+    """
+    NumPy arrays packed into one shared-memory block.
+
+    spec is a small picklable description (block name, dtype, shape, offset per
+    array). Workers map the arrays from it without copying, so a batch crosses
+    the process boundary as a few hundred bytes instead of a pickled DataFrame.
+    The creator unlinks the block on close.
+    """
+    def __init__(self, arrays: dict):
+        arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+        layout = []
+        offset = 0
+        for name, array in arrays.items():
+            layout.append((name, array.dtype.str, array.shape, offset))
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        self.shm = SharedMemory(create=True, size=max(offset, 1))
+        for (name, dtype, shape, start) in layout:
+            view = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=start)
+            view[...] = arrays[name]
+            del view
+
+        self.spec = {"name": self.shm.name, "arrays": layout}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _run_shard(fn, spec: dict, start: int, stop: int, args: tuple):
+    # Runs in a worker: maps rows [start, stop) of every shared array and applies fn
+    shm = SharedMemory(name=spec["name"])
+    try:
+        arrays = {
+            name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[start:stop]
+            for name, dtype, shape, offset in spec["arrays"]
+        }
+        result = fn(arrays, *args)
+        # fn must return new arrays; views into the block would keep it open
+        del arrays
+        return result
+    finally:
+        shm.close()
+
+
+def map_shards(fn, arrays: dict, rows: int, *args) -> list:
+    """
+    Splits rows into one contiguous shard per worker and returns fn(shard_arrays, *args)
+    for each, in row order. fn must be a module-level function (it is sent by
+    reference) and all arrays must have rows as their first dimension.
+    """
+    shards = min(worker_count(), max(1, rows))
+    bounds = np.linspace(0, rows, shards + 1).astype(np.int64)
+
+    pool = get_worker_pool()
+    with SharedArrays(arrays) as shared:
+        futures = [
+            pool.submit(_run_shard, fn, shared.spec, int(start), int(stop), args)
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from service.etl.customer_merge import dated_partials
+from service.etl.partials import BatchPartials
+
+
+def chunk(rows: list) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=['id', 'msisdn', 'transaction_amount', 'transaction_time'])
+    df['transaction_time'] = pd.to_datetime(df['transaction_time'])
+    return df
+
+
+def test_transactions_without_a_time_are_left_out_of_customer_partials():
+    partials = BatchPartials()
+    partials.update(chunk([
+        (1, '254700000001', 100.0, '2024-01-01 12:00:00'),
+        (2, '254700000001', 50.0, None),
+        # A new customer whose only transaction has an unparseable TransTime
+        (3, '254700000002', 75.0, None),
+    ]))
+
+    customers = partials.customers()
+
+    assert customers['msisdn'].tolist() == ['254700000001']
+    assert customers['total_transactions'].tolist() == [1]
+    assert customers['total_spend'].tolist() == [100.0]
+    assert customers['first_seen'].notna().all() and customers['last_seen'].notna().all()
+    # Batch totals still count every transaction
+    assert partials.total_transactions == 3
+
+
+def test_dated_partials_drops_customers_without_a_last_seen():
+    grouped = pd.DataFrame({
+        'msisdn': ['254700000001', '254700000002', None],
+        'total_transactions': [1, 1, 1],
+        'total_spend': [100.0, 75.0, 10.0],
+        'first_seen': pd.to_datetime(['2024-01-01 12:00:00', None, '2024-01-01 13:00:00']),
+        'last_seen': pd.to_datetime(['2024-01-01 12:00:00', None, '2024-01-01 13:00:00']),
+    })
+
+    assert dated_partials(grouped)['msisdn'].tolist() == ['254700000001']
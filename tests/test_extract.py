@@ -0,0 +1,37 @@
+import io
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from service.etl.extract import TransactionExtractor
+
+COPY_CSV = (
+    "id,transaction_id,msisdn,transaction_time,amount_cents\n"
+    "1,RKT1,254700000001,2024-01-01 09:00:00,1000\n"
+    "2,RKT2,,2024-01-01 18:30:00,\n"
+    "3,RKT3,254700000002,,9007199254740993\n"
+)
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    monkeypatch.setattr(TransactionExtractor, "create_engine", lambda self: None)
+    return TransactionExtractor(backend="copy")
+
+
+def test_copy_frame_keeps_amount_cents_integer_with_nulls(extractor):
+    df = extractor._copy_frame([extractor._read_copy_csv(io.BytesIO(COPY_CSV.encode()))])
+
+    assert str(df['amount_cents'].dtype) == 'Int64'
+    assert df['amount_cents'][0] == 1000 and df['amount_cents'].isna()[1]
+    # Beyond float64's exact integers, so it would be rounded had the column become float
+    assert df['amount_cents'][2] == 9007199254740993
+    assert str(df['id'].dtype) == 'int64'
+    assert df['transaction_amount'].dtype == 'float64'
+
+
+def test_copy_frame_reads_null_strings_as_null(extractor):
+    df = extractor._copy_frame([extractor._read_copy_csv(io.BytesIO(COPY_CSV.encode()))])
+
+    assert df['msisdn'].isna().tolist() == [False, True, False]
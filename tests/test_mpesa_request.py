@@ -0,0 +1,42 @@
+import pytest
+
+from api.models import MpesaRequest
+
+
+def confirmation(amount: str) -> MpesaRequest:
+    return MpesaRequest(
+        TransactionType="Pay Bill",
+        TransID="RKTQDM7W6S",
+        TransTime="20240101123045",
+        TransAmount=amount,
+        BusinessShortCode="600638",
+        MSISDN="254708374149",
+        FirstName="John",
+    )
+
+
+@pytest.mark.parametrize("amount, cents", [
+    ("10", 1000),
+    (" 10.005 ", 1001),
+    ("92233720368547758.07", 2 ** 63 - 1),
+])
+def test_amount_cents(amount, cents):
+    assert confirmation(amount).amount_cents() == cents
+
+
+@pytest.mark.parametrize("amount", [
+    "abc",
+    "NaN",
+    "Infinity",
+    # Too many digits for quantize
+    "1e26",
+    # Parses, but does not fit the BIGINT column
+    "1e19",
+    "92233720368547758.08",
+    "-1e19",
+])
+def test_amount_cents_is_none_when_not_storable(amount):
+    request = confirmation(amount)
+    assert request.amount_cents() is None
+    # The row is still built, with a NULL amount_cents
+    assert request.to_row()[-1] is None
@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from service.etl.extract import TransactionExtractor
+from service.etl.parquet_cache import TransactionParquetCache
+
+
+def transactions() -> pd.DataFrame:
+    return pd.DataFrame({
+        'id': [1, 2, 3],
+        'transaction_id': ['RKT1', 'RKT2', 'RKT3'],
+        'msisdn': ['254700000001', '254700000002', '254700000001'],
+        'transaction_time': pd.to_datetime(['2024-01-01 09:00:00', '2024-01-01 18:30:00', '2024-01-02 07:15:00']),
+        'amount_cents': pd.array([1000, 2550, 99], dtype='Int64'),
+    })
+
+
+@pytest.fixture
+def extractor(tmp_path, monkeypatch):
+    monkeypatch.setenv("ETL_PARQUET_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("ETL_EXTRACT_SOURCE", "parquet")
+    # The parquet source never connects to Postgres
+    monkeypatch.setattr(TransactionExtractor, "create_engine", lambda self: None)
+    TransactionParquetCache(str(tmp_path)).append(transactions())
+    return TransactionExtractor()
+
+
+def test_extract_reads_the_mirrored_partitions_past_the_watermark(extractor):
+    df = extractor.extract(after_id=1)
+
+    assert df['id'].tolist() == [2, 3]
+    assert df['transaction_amount'].tolist() == [25.5, 0.99]
+    assert df['transaction_time'].tolist() == list(transactions()['transaction_time'][1:])
+
+
+def test_extract_chunks_reads_the_mirror_in_batches(extractor):
+    chunks = list(extractor.extract_chunks(after_id=0, chunk_size=1))
+
+    assert all(len(chunk) == 1 for chunk in chunks)
+    assert sorted(pd.concat(chunks)['id'].tolist()) == [1, 2, 3]
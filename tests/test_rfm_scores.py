@@ -0,0 +1,26 @@
+import pandas as pd
+
+from service.etl.rfm_scores import RFMSketchStore, score_rfm
+
+
+def customers() -> pd.DataFrame:
+    return pd.DataFrame({
+        'last_seen': pd.to_datetime([f'2024-01-{day:02d} 12:00:00' for day in range(1, 11)]),
+        'total_transactions': range(1, 11),
+        'avg_spend': [float(spend) for spend in range(10, 110, 10)],
+    })
+
+
+def test_a_more_recent_payment_scores_higher():
+    df = customers()
+    scores = score_rfm(df, RFMSketchStore(k=200).batch_sketches(df))
+
+    assert list(scores['r_score']) == sorted(scores['r_score'])
+    assert scores['r_score'][0] == 1 and scores['r_score'][-1] == 5
+
+
+def test_missing_last_seen_is_not_sketched():
+    df = customers()
+    df.loc[0, 'last_seen'] = pd.NaT
+
+    assert RFMSketchStore(k=200).batch_sketches(df)['recency'].n == len(df) - 1
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from service.etl.transform import TransactionTransformer
+
+
+def batch(msisdn_dtype: str) -> pd.DataFrame:
+    return pd.DataFrame({
+        'msisdn': pd.Series(['254700000002', '254700000001', '254700000002', '254700000003'], dtype=msisdn_dtype),
+        'transaction_id': ['RKT1', 'RKT2', 'RKT3', 'RKT4'],
+        'transaction_amount': [100.0, 50.0, 25.0, 10.0],
+        'transaction_time': pd.to_datetime(['2024-01-01 09:00', '2024-01-01 10:00', '2024-01-02 11:00', '2024-01-03 12:00']),
+    })
+
+
+@pytest.mark.parametrize("msisdn_dtype", ["category", "object"])
+def test_group_customers_matches_on_workers_and_in_process(monkeypatch, msisdn_dtype):
+    # group_customers reads no transformer state, so no database is needed
+    transformer = TransactionTransformer.__new__(TransactionTransformer)
+
+    monkeypatch.setenv("ETL_WORKER_MIN_ROWS", "1000000")
+    in_process = transformer.group_customers(batch(msisdn_dtype))
+    monkeypatch.setenv("ETL_WORKER_MIN_ROWS", "1")
+    on_workers = transformer.group_customers(batch(msisdn_dtype))
+
+    pd.testing.assert_frame_equal(on_workers, in_process, check_dtype=True)
+
+
+def legacy_peak_hours(df: pd.DataFrame) -> pd.DataFrame:
+    # The pivot_table get_peak_hours used to build
+    df = df.assign(hour=df['transaction_time'].dt.hour + 1, day_of_week=df['transaction_time'].dt.day_name())
+    pivot = df.pivot_table(index='day_of_week', columns='hour', values='transaction_id', aggfunc='count', fill_value=0)
+    return pivot.reindex(columns=list(range(1, 25)), fill_value=0) \
+        .reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']).fillna(0)
+
+
+def test_get_peak_hours_matches_the_legacy_pivot_table():
+    times = pd.date_range('2024-01-01', periods=500, freq='37min').to_series(index=range(500))
+    times[[3, 77]] = pd.NaT
+    df = pd.DataFrame({
+        'transaction_id': [f'RKT{i}' for i in range(500)],
+        'msisdn': '254700000001',
+        'transaction_amount': 10.0,
+        'transaction_time': times,
+    })
+
+    peak_hours = TransactionTransformer.__new__(TransactionTransformer).get_peak_hours(df)
+
+    expected = legacy_peak_hours(df)
+    assert peak_hours.index.tolist() == expected.index.tolist()
+    assert peak_hours.columns.tolist() == expected.columns.tolist()
+    assert (peak_hours.to_numpy() == expected.to_numpy()).all()
+    # The caller's frame gains no columns
+    assert df.columns.tolist() == ['transaction_id', 'msisdn', 'transaction_amount', 'transaction_time']